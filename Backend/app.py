@@ -1,11 +1,13 @@
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
 
+from Backend.services.openai_compatible_client import close_shared_async_openai_compatible_clients
 from Backend.subapps.chat_routes import router as chat_router
-from Backend.subapps.upload_routes import router as uploads_router
+from Backend.subapps.upload_routes import UploadSizeLimitMiddleware, router as uploads_router
 
 
 _ROOT = Path(__file__).resolve().parents[1]
@@ -20,6 +22,13 @@ def _configure_logging() -> None:
 
 _configure_logging()
 
-app = FastAPI()
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    yield
+    await close_shared_async_openai_compatible_clients()
+
+
+app = FastAPI(lifespan=_lifespan)
 app.include_router(chat_router)
 app.include_router(uploads_router)
+app.add_middleware(UploadSizeLimitMiddleware)
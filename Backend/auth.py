@@ -57,6 +57,11 @@ def get_public_key(token):
 
 # Verifies the Clerk bearer token from the Authorization header and returns decoded JWT claims
 def verify_clerk_jwt(request: Request):
+    # Verified claims are cached on request.state so repeat calls within one request skip the RS256 check
+    cached = getattr(request.state, "user", None)
+    if cached is not None:
+        return cached
+
     _, audience, issuer = _get_auth_config()
     if not audience:
         logger.warning("CLERK_AUDIENCE is not set; audience claim will not be checked.")
@@ -79,6 +84,7 @@ def verify_clerk_jwt(request: Request):
             issuer=issuer,
             options={"verify_aud": False} if not audience else {},
         )
+        request.state.user = payload
         return payload
     except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Token verification failed: {str(e)}")
@@ -12,6 +12,7 @@ import time
 import random
 from Backend.celery import celery
 from Backend.database import SessionLocal
+from Backend.health_data_version import bump_health_data_version
 
 
 logger = logging.getLogger(__name__)
@@ -27,10 +28,11 @@ def _parse_csv_bytes(data: bytes) -> pd.DataFrame:
 
 
 @celery.task(name = "process_csv_upload")
-def process_csv_upload(user_id: str, csv_bytes_b4: str) -> dict[str, int]:
+def process_csv_upload(user_id: str, csv_data: bytes | str) -> dict[str, int]:
     time.sleep(random.uniform(0.1, 0.5))  # Add a small random delay to help prevent exact simultaneous processing
 
-    raw = base64.b64decode(csv_bytes_b4)
+    # Raw bytes arrive via msgpack; a str is a base64 payload from a JSON-serialized (older) message.
+    raw = csv_data if isinstance(csv_data, bytes) else base64.b64decode(csv_data)
     df = _parse_csv_bytes(raw)
 
     df["timestamp"] = pd.to_datetime(df["timestamp"], utc = True, errors = "coerce")
@@ -44,9 +46,8 @@ def process_csv_upload(user_id: str, csv_bytes_b4: str) -> dict[str, int]:
     # - CSVs may contain a different/old/malformed user_id (e.g., client-side bugs, casing issues).
     # To prevent cross-user writes AND avoid dropping all rows on mismatch, always stamp rows with the
     # authenticated user_id.
-    if "user_id" not in df.columns:
-        df["user_id"] = user_id
-    else:
+    # The distinct-id scan only feeds a log line, so skip the full-column pass when WARNING is filtered out.
+    if "user_id" in df.columns and logger.isEnabledFor(logging.WARNING):
         try:
             # Log distinct CSV user_ids for debugging, but do not trust them.
             uniq = df["user_id"].dropna().astype(str).str.strip().unique().tolist()
@@ -58,7 +59,7 @@ def process_csv_upload(user_id: str, csv_bytes_b4: str) -> dict[str, int]:
                 )
         except Exception:
             pass
-        df["user_id"] = user_id
+    df["user_id"] = user_id
 
     if df.empty:
         logger.info("process_csv_upload: no rows for user_id=%s after filter; nothing to insert", user_id)
@@ -1475,5 +1476,7 @@ def process_csv_upload(user_id: str, csv_bytes_b4: str) -> dict[str, int]:
             except Exception:
                 logger.exception("process_csv_upload: rollback failed after derive derived_workout_segments user_id=%s", user_id)
 
+    # New rows are committed; cached chat query results for this user (in every web worker) are now stale.
+    bump_health_data_version(user_id)
     logger.info("process_csv_upload: done user_id=%s metrics=%s events=%s", user_id, len(df_metrics), len(df_events))
     return {"inserted": int(len(df_metrics) + len(df_events))}
\ No newline at end of file
@@ -12,7 +12,8 @@ def make_celery() -> Celery:
     app = Celery("voyant", broker=broker, backend=backend)
     app.conf.update(
         task_serializer="json",
-        accept_content=["json"],
+        # msgpack carries the raw CSV bytes for process_csv_upload
+        accept_content=["json", "msgpack"],
         result_serializer="json",
         timezone="UTC",
         enable_utc=True,
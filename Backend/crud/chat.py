@@ -1,4 +1,4 @@
-from sqlalchemy import func
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
 
 from Backend.models.chat_models import ChatMessage, ChatSession
@@ -21,14 +21,28 @@ def create_chat_message(session, conversation_id, user_id, role, content):
     return msg
 
 
-# Get chat history for a conversation
-def get_chat_history(session, conversation_id, user_id):
-    return (
-        session.query(ChatMessage)
+# Get (role, content) for the most recent `limit` messages of a conversation, oldest first (no ORM hydration)
+def get_chat_history_turns(session, conversation_id, user_id, limit=None):
+    stmt = (
+        select(ChatMessage.role, ChatMessage.content)
+        .where(ChatMessage.conversation_id == conversation_id, ChatMessage.user_id == user_id)
+        .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    rows = session.execute(stmt).all()
+    rows.reverse()
+    return rows
+
+
+# Get chat history for a conversation (async session)
+async def get_chat_history_async(session, conversation_id, user_id):
+    result = await session.execute(
+        select(ChatMessage)
         .filter_by(conversation_id=conversation_id, user_id=user_id)
         .order_by(ChatMessage.timestamp, ChatMessage.id)
-        .all()
     )
+    return result.scalars().all()
 
 
 # Get existing conversation or create a new one
@@ -73,37 +87,27 @@ def update_conversation_title(session, conversation_id, user_id, title):
     return conv
 
 
-# Get chat sessions for a user with last-active timestamps + titles
-def get_chat_sessions(session, user_id):
-    subquery = (
-        session.query(
+# Get chat sessions for a user with last-active timestamps + titles (one grouped query, titles outer-joined)
+async def get_chat_sessions(session, user_id):
+    result = await session.execute(
+        select(
             ChatMessage.conversation_id,
             func.max(ChatMessage.timestamp).label("last_message_at"),
+            ChatSession.title,
         )
-        .filter(ChatMessage.user_id == user_id)
-        .group_by(ChatMessage.conversation_id)
-        .subquery()
-    )
-
-    latest_messages = (
-        session.query(ChatMessage)
-        .join(
-            subquery,
-            (ChatMessage.conversation_id == subquery.c.conversation_id) & (ChatMessage.timestamp == subquery.c.last_message_at),
+        .outerjoin(
+            ChatSession,
+            (ChatSession.conversation_id == ChatMessage.conversation_id) & (ChatSession.user_id == ChatMessage.user_id),
         )
-        .filter(ChatMessage.user_id == user_id)
-        .all()
+        .where(ChatMessage.user_id == user_id)
+        .group_by(ChatMessage.conversation_id, ChatSession.title)
     )
-
-    conversations = session.query(ChatSession).filter_by(user_id=user_id).all()
-    titles = {conv.conversation_id: conv.title for conv in conversations}
+    rows = result.all()
     return [
         {
-            "conversation_id": msg.conversation_id,
-            "title": titles.get(msg.conversation_id),
-            "last_active_date": msg.timestamp.isoformat() if msg.timestamp else None,
+            "conversation_id": conversation_id,
+            "title": title,
+            "last_active_date": last_message_at.isoformat() if last_message_at else None,
         }
-        for msg in latest_messages
+        for conversation_id, last_message_at, title in rows
     ]
-
-
@@ -1,29 +1,119 @@
 from __future__ import annotations
 
-from typing import Optional
+from datetime import datetime
+from typing import Any, Iterable, Optional
 
-from sqlalchemy import select
+from sqlalchemy import Row, bindparam, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from Backend.models.health_upload_tracking_model import HealthUploadTracking
 
+# Hot lookups built once with bind parameters (task-status polling hits these on every request),
+# so each call skips statement construction and cache-key generation.
+_Q_BY_USER_AND_HASH = select(HealthUploadTracking).where(
+    HealthUploadTracking.user_id == bindparam("user_id"),
+    HealthUploadTracking.id == bindparam("content_hash"),
+)
+_Q_BY_USER_AND_TASK = select(HealthUploadTracking).where(
+    HealthUploadTracking.user_id == bindparam("user_id"),
+    HealthUploadTracking.task_id == bindparam("task_id"),
+)
+_Q_LATEST_ACTIVE_TASK_ID = (
+    select(HealthUploadTracking.task_id)
+    .where(
+        HealthUploadTracking.user_id == bindparam("user_id"),
+        HealthUploadTracking.status.in_(["pending", "processing"]),
+    )
+    .order_by(HealthUploadTracking.created_at.desc())
+    .limit(1)
+)
+_Q_SEED_BATCH = (
+    select(HealthUploadTracking)
+    .where(
+        HealthUploadTracking.user_id == bindparam("user_id"),
+        HealthUploadTracking.upload_mode == "seed",
+        HealthUploadTracking.seed_batch_id == bindparam("batch_id"),
+    )
+    .order_by(HealthUploadTracking.created_at.desc())
+    .limit(bindparam("limit"))
+)
+_Q_LATEST_SEED_BATCH_ID = (
+    select(HealthUploadTracking.seed_batch_id)
+    .where(
+        HealthUploadTracking.user_id == bindparam("user_id"),
+        HealthUploadTracking.upload_mode == "seed",
+        HealthUploadTracking.seed_batch_id.isnot(None),
+    )
+    .order_by(HealthUploadTracking.created_at.desc())
+    .limit(1)
+)
+
 
 # Get upload tracking row by (user_id, content_hash)
 def get_by_user_and_hash(db: Session, user_id: str, content_hash: str) -> Optional[HealthUploadTracking]:
-    stmt = select(HealthUploadTracking).where(
-        HealthUploadTracking.user_id == user_id,
-        HealthUploadTracking.id == content_hash,
-    )
-    return db.execute(stmt).scalar_one_or_none()
+    return db.execute(_Q_BY_USER_AND_HASH, {"user_id": user_id, "content_hash": content_hash}).scalar_one_or_none()
 
 
 # Get upload tracking row by (user_id, task_id)
 def get_by_user_and_task_id(db: Session, user_id: str, task_id: str) -> Optional[HealthUploadTracking]:
-    stmt = select(HealthUploadTracking).where(
+    return db.execute(_Q_BY_USER_AND_TASK, {"user_id": user_id, "task_id": task_id}).scalar_one_or_none()
+
+
+# Task id of the user's newest pending/processing upload (None if there is none, or it has no task yet)
+def get_latest_active_task_id(db: Session, *, user_id: str) -> Optional[str]:
+    return db.execute(_Q_LATEST_ACTIVE_TASK_ID, {"user_id": user_id}).scalar_one_or_none()
+
+
+# Insert a new tracking row, or bump request_count if (user_id, content_hash) already exists, in one statement.
+# Returns (task_id of the stored row, whether this call inserted it).
+def insert_or_bump(db: Session, *, values: dict) -> tuple[Optional[str], bool]:
+    stmt = (
+        pg_insert(HealthUploadTracking)
+        .values(**values)
+        .on_conflict_do_update(
+            index_elements=[HealthUploadTracking.id, HealthUploadTracking.user_id],
+            set_={
+                "request_count": HealthUploadTracking.request_count + 1,
+                "updated_at": func.now(),
+            },
+        )
+        # xmax is 0 only for a freshly inserted tuple
+        .returning(HealthUploadTracking.task_id, literal_column("(xmax = 0)").label("inserted"))
+    )
+    row = db.execute(stmt).one()
+    return row.task_id, bool(row.inserted)
+
+
+# Compare-and-set a row's status in one UPDATE (no SELECT first); the WHERE clause carries the guard, so
+# the steady-state poll (nothing to change) is a single no-op statement.
+# Returns (id, created_at) of the updated row, or None when the guard didn't match.
+def transition_status(
+    db: Session,
+    *,
+    user_id: str,
+    task_id: str,
+    values: dict[str, Any],
+    from_statuses: Optional[Iterable[str]] = None,
+    not_from_statuses: Optional[Iterable[str]] = None,
+    created_before: Optional[datetime] = None,
+) -> Optional[Row]:
+    stmt = update(HealthUploadTracking).where(
         HealthUploadTracking.user_id == user_id,
         HealthUploadTracking.task_id == task_id,
     )
-    return db.execute(stmt).scalar_one_or_none()
+    if from_statuses is not None:
+        stmt = stmt.where(HealthUploadTracking.status.in_(list(from_statuses)))
+    if not_from_statuses is not None:
+        stmt = stmt.where(HealthUploadTracking.status.notin_(list(not_from_statuses)))
+    if created_before is not None:
+        stmt = stmt.where(HealthUploadTracking.created_at < created_before)
+    stmt = (
+        stmt.values(**values)
+        .returning(HealthUploadTracking.id, HealthUploadTracking.created_at)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).first()
 
 
 def list_seed_batch(
@@ -33,28 +123,9 @@ def list_seed_batch(
     batch_id: str,
     limit: int = 200,
 ) -> list[HealthUploadTracking]:
-    stmt = (
-        select(HealthUploadTracking)
-        .where(
-            HealthUploadTracking.user_id == user_id,
-            HealthUploadTracking.upload_mode == "seed",
-            HealthUploadTracking.seed_batch_id == batch_id,
-        )
-        .order_by(HealthUploadTracking.created_at.desc())
-        .limit(int(limit))
-    )
-    return list(db.execute(stmt).scalars().all())
+    params = {"user_id": user_id, "batch_id": batch_id, "limit": int(limit)}
+    return list(db.execute(_Q_SEED_BATCH, params).scalars().all())
 
 
 def get_latest_seed_batch_id(db: Session, *, user_id: str) -> Optional[str]:
-    stmt = (
-        select(HealthUploadTracking.seed_batch_id)
-        .where(
-            HealthUploadTracking.user_id == user_id,
-            HealthUploadTracking.upload_mode == "seed",
-            HealthUploadTracking.seed_batch_id.isnot(None),
-        )
-        .order_by(HealthUploadTracking.created_at.desc())
-        .limit(1)
-    )
-    return db.execute(stmt).scalar_one_or_none()
\ No newline at end of file
+    return db.execute(_Q_LATEST_SEED_BATCH_ID, {"user_id": user_id}).scalar_one_or_none()
\ No newline at end of file
@@ -3,6 +3,8 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 _ROOT = Path(__file__).resolve().parents[1]
@@ -15,6 +17,22 @@ if not DATABASE_URL:
 engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args={"connect_timeout": 5})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+# Same database through asyncpg, for request-path reads that shouldn't hop onto a worker thread.
+def _async_database_url(url: str):
+    u = make_url(url).set(drivername="postgresql+asyncpg")
+    # asyncpg takes ssl=..., not libpq's sslmode=...
+    sslmode = u.query.get("sslmode")
+    if sslmode:
+        u = u.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return u
+
+
+async_engine = create_async_engine(
+    _async_database_url(DATABASE_URL), pool_pre_ping=True, connect_args={"timeout": 5}
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -26,4 +44,9 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 
@@ -0,0 +1,44 @@
+"""add indexes for the sql-gen timezone rewrite probes
+
+Revision ID: n8o9p0q1r2s3
+Revises: b26e4b769a25
+Create Date: 2026-01-10
+"""
+
+from alembic import op
+
+
+revision = "n8o9p0q1r2s3"
+down_revision = "b26e4b769a25"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Workout event probe: user_id + timestamp = ANY(...) restricted to workout_* events
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_health_events_workout_user_ts
+        ON main_health_events (user_id, timestamp)
+        WHERE event_type LIKE 'workout_%';
+        """
+    )
+    # Rollup probe: (user_id, bucket_ts) with an optional metric_type; the PKs lead with metric_type
+    op.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_rollup_hourly_user_ts_metric
+        ON derived_rollup_hourly (user_id, bucket_ts, metric_type);
+        """
+    )
+    op.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_rollup_daily_user_ts_metric
+        ON derived_rollup_daily (user_id, bucket_ts, metric_type);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_rollup_daily_user_ts_metric;")
+    op.execute("DROP INDEX IF EXISTS idx_rollup_hourly_user_ts_metric;")
+    op.execute("DROP INDEX IF EXISTS idx_health_events_workout_user_ts;")
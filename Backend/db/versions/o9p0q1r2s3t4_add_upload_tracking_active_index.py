@@ -0,0 +1,30 @@
+"""add partial index for in-flight upload tracking rows
+
+Revision ID: o9p0q1r2s3t4
+Revises: n8o9p0q1r2s3
+Create Date: 2026-01-12
+"""
+
+from alembic import op
+
+
+revision = "o9p0q1r2s3t4"
+down_revision = "n8o9p0q1r2s3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Delta-upload coalescing: newest pending/processing row for a user. Only in-flight rows are indexed,
+    # so the index stays tiny while the tracking table keeps growing with completed uploads.
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_health_upload_tracking_active
+        ON health_upload_tracking (user_id, created_at DESC)
+        WHERE status IN ('pending', 'processing');
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_health_upload_tracking_active;")
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+
+# Per-user health-data version kept in Redis. The CSV ingest task bumps it once new rows are committed.
+# Per-process caches of query results stamp entries with the version they were computed under and treat any
+# other version as a miss, so every web worker sees the change without the ingest side knowing about them.
+_VERSION_TTL_SECONDS = 7 * 24 * 3600
+# The chat path reads the version on every tool call; a slow or blackholed Redis must degrade to "no
+# version" (cache bypass) quickly instead of stalling the call.
+_READ_TIMEOUT_SECONDS = 0.25
+_WRITE_TIMEOUT_SECONDS = 2.0
+
+_sync_client: Optional[redis.Redis] = None
+_async_client: Optional[aioredis.Redis] = None
+
+
+def _redis_url() -> str:
+    redis_url = os.getenv("REDIS_URL") or os.getenv("CELERY_BROKER_URL")
+    if not redis_url:
+        raise RuntimeError("REDIS_URL (or CELERY_BROKER_URL) must be set for health data versioning.")
+    return redis_url
+
+
+def _key(user_id: str) -> str:
+    return f"health_data_version:{user_id}"
+
+
+# Called from the ingest worker after a successful upload; best-effort (cache TTLs still bound staleness)
+def bump_health_data_version(user_id: str) -> None:
+    global _sync_client
+    try:
+        if _sync_client is None:
+            _sync_client = redis.from_url(
+                _redis_url(),
+                decode_responses=True,
+                socket_connect_timeout=_WRITE_TIMEOUT_SECONDS,
+                socket_timeout=_WRITE_TIMEOUT_SECONDS,
+            )
+        pipe = _sync_client.pipeline()
+        pipe.incr(_key(user_id))
+        pipe.expire(_key(user_id), _VERSION_TTL_SECONDS)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+# Current version for a user ("0" if nothing was ever ingested), or None if Redis can't be reached;
+# callers should not serve cached results without a version.
+async def get_health_data_version(user_id: str) -> Optional[str]:
+    global _async_client
+    try:
+        if _async_client is None:
+            _async_client = aioredis.from_url(
+                _redis_url(),
+                decode_responses=True,
+                socket_connect_timeout=_READ_TIMEOUT_SECONDS,
+                socket_timeout=_READ_TIMEOUT_SECONDS,
+            )
+        return await _async_client.get(_key(user_id)) or "0"
+    except Exception:
+        return None
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Integer, String, Text, func
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, func, text
 
 from Backend.database import Base
 
@@ -7,6 +7,16 @@ from Backend.database import Base
 class HealthUploadTracking(Base):
     __tablename__ = "health_upload_tracking"
 
+    # Partial index over in-flight rows only (delta-upload coalescing lookup)
+    __table_args__ = (
+        Index(
+            "ix_health_upload_tracking_active",
+            "user_id",
+            text("created_at DESC"),
+            postgresql_where=text("status IN ('pending', 'processing')"),
+        ),
+    )
+
     id = Column(String(64), primary_key=True)  # SHA256 hash of content
     user_id = Column(String(100), primary_key=True)
     task_id = Column(String(100), nullable=True)
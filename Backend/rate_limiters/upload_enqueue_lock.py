@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import redis
+
+
+# Matches the service's processing timeout: a claim outlives any ingest that is still considered in progress.
+DEFAULT_LOCK_TTL_SECONDS = 300
+
+
+# Claim-or-read as one atomic script, so an expiry between a failed SET NX and the follow-up GET can't
+# leave the caller believing it holds a claim it never set. KEYS = {claim}; ARGV = {task_id, ttl}.
+# Returns the holder's task id, or nil when this call took the claim.
+_CLAIM_LUA = """
+local holder = redis.call('GET', KEYS[1])
+if holder then
+  return holder
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', tonumber(ARGV[2]))
+return false
+"""
+
+
+# One ingest enqueue per (user, content hash) at a time, claimed with SET NX EX.
+# The tracking table only sees a new upload after its task is enqueued. Without a claim, two requests
+# for the same file (client retry, double submit, DB hiccup) could both enqueue a full ingest.
+class RedisUploadEnqueueLock:
+    def __init__(self, redis_url: str, ttl_seconds: int = DEFAULT_LOCK_TTL_SECONDS):
+        self.ttl_seconds = int(ttl_seconds)
+        self._client = redis.from_url(redis_url, decode_responses=True)
+        self._claim_script = self._client.register_script(_CLAIM_LUA)
+
+    @staticmethod
+    def _key(user_id: str, content_hash: str) -> str:
+        return f"csv:lock:{user_id}:{content_hash}"
+
+    # Returns None when this caller holds the claim (and should enqueue `task_id`), otherwise the task id
+    # of the enqueue already holding it. Fails open (None) if Redis is unavailable.
+    def claim(self, user_id: str, content_hash: str, task_id: str) -> Optional[str]:
+        try:
+            return self._claim_script(keys=[self._key(user_id, content_hash)], args=[task_id, self.ttl_seconds])
+        except Exception:
+            return None
+
+    # Drops a claim whose enqueue failed, so a retry isn't pointed at a task that never existed
+    def release(self, user_id: str, content_hash: str) -> None:
+        try:
+            self._client.delete(self._key(user_id, content_hash))
+        except Exception:
+            pass
+
+
+_singleton: Optional[RedisUploadEnqueueLock] = None
+
+
+def get_upload_enqueue_lock() -> RedisUploadEnqueueLock:
+    global _singleton
+    if _singleton is not None:
+        return _singleton
+
+    redis_url = os.getenv("REDIS_URL") or os.getenv("CELERY_BROKER_URL")
+    if not redis_url:
+        raise RuntimeError("REDIS_URL (or CELERY_BROKER_URL) must be set for upload enqueue locking.")
+    _singleton = RedisUploadEnqueueLock(redis_url=redis_url)
+    return _singleton
+
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import os
+import time
 from dataclasses import dataclass
-from datetime import datetime, timezone
 from typing import Optional
 
 import redis
@@ -14,6 +14,32 @@ class RateLimitDecision:
     wait_seconds: int = 0
 
 
+# Sliding-window counter as one atomic script: a counter per fixed window, with the previous window's count
+# weighted by how much of it still overlaps the sliding window. Two small integers per user instead of a
+# timestamp per request. KEYS = {current window, previous window}; ARGV = {limit, window, seconds into current}.
+# Returns {allowed (0/1), wait_seconds}.
+_SLIDING_COUNTER_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local cur = tonumber(redis.call('GET', KEYS[1]) or '0')
+local prev = tonumber(redis.call('GET', KEYS[2]) or '0')
+if prev * (window - elapsed) / window + cur >= limit then
+  local wait
+  if cur >= limit then
+    -- Blocked until into the next window, where this window's count becomes the weighted one.
+    wait = (window - elapsed) + window * (1 - limit / cur)
+  else
+    wait = (window - elapsed) - (limit - cur) * window / prev
+  end
+  return {0, math.max(0, math.ceil(wait))}
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], window * 2 + 5)
+return {1, 0}
+"""
+
+
 # Limits health data CSV uploads to 10 requests per minute for a user
 class RedisUploadRateLimiter:
     def __init__(self, redis_url: str):
@@ -21,34 +47,23 @@ class RedisUploadRateLimiter:
         self.max_requests = 60
         self.window_seconds = 60
         self._client = redis.from_url(redis_url, decode_responses=True)
+        # Runs via EVALSHA (falls back to EVAL once if the script cache was flushed).
+        # One round trip per check, and concurrent uploads across workers can't both pass the limit.
+        self._check_script = self._client.register_script(_SLIDING_COUNTER_LUA)
 
     def check(self, user_id: str) -> RateLimitDecision:
-        key = f"upload_rate:{user_id}"
-        now_ts = datetime.now(timezone.utc).timestamp()  # get the current timestamp in seconds in UTC
-        min_ts = now_ts - self.window_seconds            # compute the start of the sliding window; anything with a smaller timestamp is outside the window (i.e. older than 60 seconds)
+        now_ts = time.time()  # wall-clock epoch seconds (windows must line up across workers, so not monotonic)
+        window_idx = int(now_ts // self.window_seconds)   # fixed window the request falls in
+        elapsed = now_ts - window_idx * self.window_seconds
 
         try:
-            pipe = self._client.pipeline(transaction=True)  # create a Redis pipeline so multiple commands can run together
-            pipe.zremrangebyscore(key, 0, min_ts)           # delete old request timestamps (older than the last 60 sec window)
-            pipe.zcard(key)                                 # count the number of requests in the window
-            pipe.zrange(key, 0, 0, withscores=True)         # get the oldest request in timestamp (used to compute how long until the user is allowed again if they're over the limit)
-            pipe.expire(key, self.window_seconds + 5)       # set a 5 second buffer to ensure the window is expired before the next request
-            _, count, oldest, _ = pipe.execute()            # execute the pipeline and get results
-
-            # If number of requests in window >= max requests per minute, then user is over the limit and we dismiss it
-            if int(count) >= self.max_requests:
-                oldest_ts = None
-                if oldest and isinstance(oldest, list):
-                    oldest_ts = float(oldest[0][1])
-                if oldest_ts is None:
-                    return RateLimitDecision(allowed=False, wait_seconds=self.window_seconds)
-                wait_s = max(0, int((oldest_ts + self.window_seconds) - now_ts))
-                return RateLimitDecision(allowed=False, wait_seconds=wait_s)
-
-            # If the user under the limit, add the current request
-            self._client.zadd(key, {str(now_ts): now_ts})
-            self._client.expire(key, self.window_seconds + 5)
-            return RateLimitDecision(allowed=True, wait_seconds=0)
+            allowed, wait_s = self._check_script(
+                keys=[f"upload_rate:{user_id}:{window_idx}", f"upload_rate:{user_id}:{window_idx - 1}"],
+                args=[self.max_requests, self.window_seconds, elapsed],
+            )
+            if int(allowed):
+                return RateLimitDecision(allowed=True, wait_seconds=0)
+            return RateLimitDecision(allowed=False, wait_seconds=int(wait_s))
         # If Redis is down/unreachable, do not block uploads and allow the upload
         except Exception:
             return RateLimitDecision(allowed=True, wait_seconds=0)
@@ -4,17 +4,22 @@ import uuid
 from typing import Optional
 
 from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from Backend.crud.chat import get_chat_history, get_chat_sessions
+from Backend.crud.chat import get_chat_history_async, get_chat_sessions
 from Backend.schemas.chat import ChatMessageOut, ChatRequest, ChatSessionsOut
 from Backend.services.chat_stream import DEFAULT_MODEL, build_agent_stream_response
 from Backend.services.tools.sql_gen_tool import execute_sql_gen_tool, localize_health_rows, TOOL_SPEC
 
+# Tool list handed to the answer model; one shared object so every request sends the same schema
+_TOOLS = [TOOL_SPEC]
+
 
 class ChatService:
-    # Initializes the service with a DB session used by CRUD helpers and streaming.
-    def __init__(self, db: Session):
+    # Initializes the service with a DB session used by CRUD helpers and streaming
+    # (an AsyncSession for the read-only list endpoints).
+    def __init__(self, db: Session | AsyncSession):
         self.db = db
 
     # Ensures we have a conversation id
@@ -22,7 +27,7 @@ class ChatService:
     def _generate_conversation_id(existing_conversation_id: Optional[str] = None) -> str:
         if existing_conversation_id:
             return existing_conversation_id
-        return str(uuid.uuid4())
+        return uuid.uuid4().hex
 
     # Validates input, wires tool handlers, then delegates SSE streaming to `build_agent_stream_response()`.
     async def stream_tool_sql(self, *, payload: ChatRequest, user_id: str, user_tz: str):
@@ -51,7 +56,8 @@ class ChatService:
                 if isinstance(ctx, dict) and isinstance(ctx.get("sql"), dict):
                     rows = ctx["sql"].get("rows")
                     if isinstance(rows, list):
-                        ctx["sql"]["rows"] = localize_health_rows(rows, user_tz)
+                        # Rows are this call's own copies (see execute_sql_gen_tool), so format them in place.
+                        ctx["sql"]["rows"] = localize_health_rows(rows, user_tz, inplace=True)
             except Exception:
                 pass
             return ctx
@@ -73,18 +79,18 @@ class ChatService:
             question=question,
             provider=provider,
             answer_model=answer_model,
-            tools=[TOOL_SPEC],
+            tools=_TOOLS,
             tool_handlers={"fetch_health_context": _health_tool_handler},
             tool_prefetch=_prefetch,
             db_session=self.db,
         )
 
-    def list_sessions(self, *, user_id: str) -> ChatSessionsOut:
-        sessions = get_chat_sessions(self.db, user_id)
+    async def list_sessions(self, *, user_id: str) -> ChatSessionsOut:
+        sessions = await get_chat_sessions(self.db, user_id)
         return ChatSessionsOut(sessions=sessions)
 
-    def list_messages(self, *, conversation_id: str, user_id: str) -> list[ChatMessageOut]:
-        messages = get_chat_history(self.db, conversation_id, user_id)
+    async def list_messages(self, *, conversation_id: str, user_id: str) -> list[ChatMessageOut]:
+        messages = await get_chat_history_async(self.db, conversation_id, user_id)
         return [
             ChatMessageOut(
                 id=m.id,
@@ -1,19 +1,49 @@
 import asyncio
 import json
 import logging
+import os
 import pathlib
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import orjson
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from Backend.crud.chat import (create_chat_message, get_chat_history, get_or_create_conversation, update_conversation_title)
+from Backend.crud.chat import (create_chat_message, get_chat_history_turns, get_or_create_conversation, update_conversation_title)
 from Backend.database import SessionLocal
-from Backend.services.openai_compatible_client import get_async_openai_compatible_client
+from Backend.services.openai_compatible_client import get_shared_async_openai_compatible_client
 
 logger = logging.getLogger(__name__)
 _BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+# Prior messages sent to the model per turn (~40 exchanges); keeps long conversations' prompts bounded
+_HISTORY_MAX_MESSAGES = 80
+_RE_TITLE_PREFIX = re.compile(r"^(?:Title:|title:)\s*", re.IGNORECASE)
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+
+# Reads a prompt from Backend/resources once per process
+@lru_cache(maxsize=8)
+def _load_prompt(name: str) -> str:
+    return (_BACKEND_DIR / "resources" / name).read_text(encoding="utf-8")
+
+
+# The chat system message, built once; identical bytes every turn keep the provider's prompt prefix cacheable
+@lru_cache(maxsize=1)
+def _system_message() -> dict:
+    return {"role": "system", "content": _load_prompt("chat_prompt.txt")}
+
+
+# Blocking chat-history DB work runs on its own pool, off the event loop and apart from the default executor
+_DB_EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 2), thread_name_prefix="voyant-db")
+
+
+async def _run_db(fn: Callable[..., Any], *args: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_DB_EXECUTOR, fn, *args)
 
 
 DEFAULT_MODEL = {
@@ -63,29 +93,30 @@ def build_agent_stream_response(
         """Generate & persist a title using an isolated DB session so it can't interfere with streaming."""
         if not is_new_conversation:
             return None
-        isolated: Optional[Session] = None
+
+        # Each DB step gets its own context-managed session, so no pooled connection is held open
+        # across the title LLM call and every exit path releases it.
+        def _needs_title() -> bool:
+            with SessionLocal() as isolated:
+                conv = get_or_create_conversation(isolated, conversation_id, user_id)
+                if not conv or getattr(conv, "title", None):
+                    return False
+                isolated.commit()
+                return True
+
+        def _save_title(title: str) -> None:
+            with SessionLocal() as isolated:
+                update_conversation_title(isolated, conversation_id, user_id, title)
+                isolated.commit()
+
         try:
-            isolated = SessionLocal()
-            conv = get_or_create_conversation(isolated, conversation_id, user_id)
-            if not conv or getattr(conv, "title", None):
+            if not await _run_db(_needs_title):
                 return None
             title = await generate_chat_title(question)
-            update_conversation_title(isolated, conversation_id, user_id, title)
-            isolated.commit()
+            await _run_db(_save_title, title)
             return title
         except Exception:
-            try:
-                if isolated is not None:
-                    isolated.rollback()
-            except Exception:
-                pass
             return None
-        finally:
-            try:
-                if isolated is not None:
-                    isolated.close()
-            except Exception:
-                pass
 
     def _title_task_done(task: asyncio.Task) -> None:
         try:
@@ -94,13 +125,19 @@ def build_agent_stream_response(
             logger.exception("chat.title.bg.error")
 
     async def generator():
-        queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=2048)
+        # Speculative SQL starts as soon as the body is iterated, before any queue/DB setup. The generation task
+        # created below (with no await in between) owns it: it awaits or cancels it on every exit path.
+        prefetch_task: Optional[asyncio.Task] = None
+        if tool_prefetch is not None:
+            try:
+                prefetch_task = asyncio.create_task(tool_prefetch())
+            except Exception:
+                prefetch_task = None
+
+        queue: asyncio.Queue[Optional[bytes]] = asyncio.Queue(maxsize=2048)
         stream_enabled = asyncio.Event()
         stream_enabled.set()
 
-        def _sse(payload: dict) -> str:
-            return f"data: {json.dumps(payload)}\n\n"
-
         def _emit_nowait(payload: dict) -> None:
             if not stream_enabled.is_set():
                 return
@@ -122,20 +159,29 @@ def build_agent_stream_response(
 
         def _load_history_msgs(session: Session) -> list[dict]:
             try:
-                prior = get_chat_history(session, conversation_id, user_id)
-                msgs: list[dict] = []
-                for m in prior:
-                    role = "assistant" if m.role == "assistant" else "user"
-                    if isinstance(m.content, str) and m.content.strip():
-                        msgs.append({"role": role, "content": m.content})
-                return msgs
+                prior = get_chat_history_turns(session, conversation_id, user_id, limit=_HISTORY_MAX_MESSAGES)
+                return [
+                    {"role": "assistant" if role == "assistant" else "user", "content": content}
+                    for role, content in prior
+                    if isinstance(content, str) and content.strip()
+                ]
             except Exception:
                 return []
 
+        def _persist_message(session: Session, role: str, content: str) -> None:
+            try:
+                create_chat_message(session, conversation_id, user_id, role, content)
+                session.commit()
+            except Exception:
+                try:
+                    session.rollback()
+                except Exception:
+                    pass
+
         async def _run_generation_bg() -> None:
-            final_client = get_async_openai_compatible_client(provider)
+            final_client = get_shared_async_openai_compatible_client(provider)
             session: Optional[Session] = None
-            sql_task: Optional[asyncio.Task] = None
+            sql_task: Optional[asyncio.Task] = prefetch_task
             title_task: Optional[asyncio.Task] = None
             title_sent = False
 
@@ -154,25 +200,18 @@ def build_agent_stream_response(
                 return res if isinstance(res, dict) else {"result": res}
 
             try:
-                system_prompt_path = _BACKEND_DIR / "resources" / "chat_prompt.txt"
-                system = system_prompt_path.read_text(encoding="utf-8")
+                # Send initial metadata chunk (conversation_id) immediately.
+                _emit_nowait({"conversation_id": conversation_id, "content": "", "done": False})
+
+                # Speculative SQL (sql_task) is already in flight, so it overlaps the DB work below and the first
+                # model pass; it is cancelled if the model doesn't call the tool.
 
                 # Always use an isolated session for persistence so request lifecycle can't invalidate it.
                 session = SessionLocal()
-                history_msgs = _load_history_msgs(session)
+                history_msgs = await _run_db(_load_history_msgs, session)
 
                 # Persist user message ASAP.
-                try:
-                    create_chat_message(session, conversation_id, user_id, "user", question)
-                    session.commit()
-                except Exception:
-                    try:
-                        session.rollback()
-                    except Exception:
-                        pass
-
-                # Send initial metadata chunk (conversation_id) immediately.
-                _emit_nowait({"conversation_id": conversation_id, "content": "", "done": False})
+                await _run_db(_persist_message, session, "user", question)
 
                 # Title generation (isolated from the streaming session).
                 try:
@@ -197,13 +236,7 @@ def build_agent_stream_response(
 
                     asyncio.create_task(_watch_title())
 
-                messages: list[dict] = [{"role": "system", "content": system}, *history_msgs, {"role": "user", "content": question}]
-
-                if tool_prefetch is not None:
-                    try:
-                        sql_task = asyncio.create_task(tool_prefetch())
-                    except Exception:
-                        sql_task = None
+                messages: list[dict] = [_system_message(), *history_msgs, {"role": "user", "content": question}]
 
                 tool_calls_acc: dict[int, dict] = {}
                 assistant_content = ""  # content from the first pass (before any tool call)
@@ -311,19 +344,14 @@ def build_agent_stream_response(
                     int((time.perf_counter() - t0_stream) * 1000),
                 )
 
+                # Close out the client's stream first; the DB write below doesn't change what it sees.
+                _emit_nowait({"content": "", "done": True})
+                _finish_queue()
+
                 # Persist final assistant message regardless of client connection.
                 final_text = full_response.strip()
                 if session and final_text:
-                    try:
-                        create_chat_message(session, conversation_id, user_id, "assistant", final_text)
-                        session.commit()
-                    except Exception:
-                        try:
-                            session.rollback()
-                        except Exception:
-                            pass
-
-                _emit_nowait({"content": "", "done": True})
+                    await _run_db(_persist_message, session, "assistant", final_text)
 
             except Exception as e:
                 logger.exception("chat.stream.error: conv=%s", conversation_id)
@@ -335,10 +363,6 @@ def build_agent_stream_response(
                         session.close()
                 except Exception:
                     pass
-                try:
-                    await final_client.close()
-                except Exception:
-                    pass
                 _finish_queue()
 
         def _bg_done(task: asyncio.Task) -> None:
@@ -355,7 +379,18 @@ def build_agent_stream_response(
                 item = await queue.get()
                 if item is None:
                     break
-                yield item
+                # Coalesce whatever else is already queued into the same write (no added latency).
+                frames = [item]
+                finished = False
+                while not queue.empty():
+                    nxt = queue.get_nowait()
+                    if nxt is None:
+                        finished = True
+                        break
+                    frames.append(nxt)
+                yield frames[0] if len(frames) == 1 else b"".join(frames)
+                if finished:
+                    break
         except asyncio.CancelledError:
             # Client disconnected / request cancelled: stop emitting to the queue,
             # but intentionally DO NOT cancel the generation task (it persists to DB).
@@ -408,6 +443,11 @@ def _extract_text_pieces_and_finish_reason(choice: Any, tool_calls_acc: Optional
     return pieces, finish_reason
 
 
+# SSE frame as UTF-8 bytes, handed to the ASGI server without a per-frame str encode
+def _sse(payload: dict) -> bytes:
+    return _SSE_PREFIX + orjson.dumps(payload) + _SSE_SUFFIX
+
+
 # JSON-serialize a value for message/tool payloads without raising
 def _json_dumps_safe(obj: object) -> str:
     def _default(o):
@@ -418,7 +458,12 @@ def _json_dumps_safe(obj: object) -> str:
             pass
         return str(o)
 
-    return json.dumps(obj, default=_default)
+    # orjson handles datetimes/dates natively (same ISO output), so _default only sees the rare odd type.
+    try:
+        return orjson.dumps(obj, default=_default).decode()
+    except TypeError:
+        # Non-str dict keys or ints beyond 64 bits; the stdlib encoder copes with both.
+        return json.dumps(obj, default=_default)
 
 
 # Accumulate streaming tool-call fragments from an OpenAI-compatible delta in an tool accumulator
@@ -461,27 +506,25 @@ def _tool_calls_for_messages(tool_calls_acc: dict[int, dict]) -> list[dict]:
 
 # Generate a short conversation title for the current conversation
 async def generate_chat_title(first_user_message: str) -> str:
-    client = get_async_openai_compatible_client("openai")
+    client = get_shared_async_openai_compatible_client("openai")
     try:
-        title_prompt_path = _BACKEND_DIR / "resources" / "chat_title_prompt.txt"
-        title_prompt = title_prompt_path.read_text(encoding="utf-8")
+        title_prompt = _load_prompt("chat_title_prompt.txt")
         response = await client.chat.completions.create(
             model="gpt-5-mini",
-            messages=[{"role": "user", "content": f"{title_prompt}{first_user_message[:100]}"}],
+            # Static instructions first, the user's text last, so the provider can reuse the cached prefix.
+            messages=[
+                {"role": "system", "content": title_prompt.strip()},
+                {"role": "user", "content": first_user_message[:100]},
+            ],
         )
         content = response.choices[0].message.content if response.choices else None
         if not content:
             return "New Chat"
         title = content.strip().strip("\"'.:")
-        title = re.sub(r"^(Title:|title:)\s*", "", title, flags=re.IGNORECASE)
+        title = _RE_TITLE_PREFIX.sub("", title)
         if len(title) > 60:
             title = title[:57] + "..."
         return title if title else "New Chat"
     except Exception:
         logger.exception("chat.title.error")
-        return "New Chat"
-    finally:
-        try:
-            await client.close()
-        except Exception:
-            pass
\ No newline at end of file
+        return "New Chat"
\ No newline at end of file
@@ -1,19 +1,21 @@
 from __future__ import annotations
 
-import base64
 import hashlib
 import logging
+import time
+import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
-from datetime import datetime, timezone
-from typing import Any, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, BinaryIO, Optional
 
 from fastapi import HTTPException
-from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from Backend.crud import health_upload_tracking as tracking_crud
 from Backend.models.health_upload_tracking_model import HealthUploadTracking
 from Backend.background_tasks.csv_ingest import process_csv_upload
+from Backend.rate_limiters.upload_enqueue_lock import get_upload_enqueue_lock
 from Backend.rate_limiters.upload_rate_limiter import get_upload_rate_limiter
 
 
@@ -22,6 +24,35 @@ logger = logging.getLogger(__name__)
 # Default service limits (kept in code to avoid env-based complexity).
 DEFAULT_PROCESSING_TIMEOUT_SECONDS = 300
 DEFAULT_MAX_UPLOAD_BYTES = 200 * 1024 * 1024  # 200MB (single-shot 60d mirror seed can be large)
+# Upload read size for hashing
+_UPLOAD_READ_CHUNK = 3 << 16
+
+# (user_id, content_hash) -> task_id for uploads known to be completed, answered from memory without a DB session.
+# Completed is terminal: no code path resets or deletes a completed tracking row, so an entry can only go stale
+# through out-of-band changes (manual DB edits). That staleness is bounded per worker by _COMPLETED_TTL_SECONDS;
+# other workers fill their own entries and otherwise take the normal tracking-table path.
+_COMPLETED_UPLOADS: "OrderedDict[tuple[str, str], tuple[float, str]]" = OrderedDict()
+_COMPLETED_TTL_SECONDS: int = 600
+_COMPLETED_MAX_ENTRIES: int = 10_000
+
+
+def _completed_get(key: tuple[str, str]) -> Optional[str]:
+    hit = _COMPLETED_UPLOADS.get(key)
+    if hit is None:
+        return None
+    stored_at, task_id = hit
+    if time.monotonic() - stored_at >= _COMPLETED_TTL_SECONDS:
+        _COMPLETED_UPLOADS.pop(key, None)
+        return None
+    _COMPLETED_UPLOADS.move_to_end(key)
+    return task_id
+
+
+def _completed_put(key: tuple[str, str], task_id: str) -> None:
+    _COMPLETED_UPLOADS[key] = (time.monotonic(), task_id)
+    _COMPLETED_UPLOADS.move_to_end(key)
+    while len(_COMPLETED_UPLOADS) > _COMPLETED_MAX_ENTRIES:
+        _COMPLETED_UPLOADS.popitem(last=False)
 
 
 def _utcnow_naive() -> datetime:
@@ -46,13 +77,30 @@ class HealthUploadService:
     ):
         self.db = db
         self.limiter = get_upload_rate_limiter()
+        self.enqueue_lock = get_upload_enqueue_lock()
         self.processing_timeout_seconds = int(processing_timeout_seconds)
         self.max_upload_bytes = int(max_upload_bytes)
 
-    def _enqueue_ingest_task(self, *, user_id: str, csv_b64: str) -> str:
-        task = process_csv_upload.delay(user_id, csv_b64)
+    # Sends the raw CSV bytes as a msgpack task (binary-safe, so no base64 step of our own)
+    def _enqueue_ingest_task(self, *, user_id: str, upload: BinaryIO, task_id: Optional[str] = None) -> str:
+        upload.seek(0)
+        task = process_csv_upload.apply_async(args=(user_id, upload.read()), serializer="msgpack", task_id=task_id)
         return task.id
 
+    # Hashes and sizes an upload chunk by chunk (413 as soon as it passes the limit) without buffering it whole
+    def _hash_upload(self, upload: BinaryIO) -> tuple[str, int]:
+        hasher = hashlib.sha256()
+        size = 0
+        while chunk := upload.read(_UPLOAD_READ_CHUNK):
+            size += len(chunk)
+            if size > self.max_upload_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Upload too large. Max size is {self.max_upload_bytes} bytes.",
+                )
+            hasher.update(chunk)
+        return hasher.hexdigest(), size
+
     def _get_ingest_task_state(self, task_id: str) -> tuple[str, Optional[Any]]:
         res = process_csv_upload.AsyncResult(task_id)
         state = res.state
@@ -69,25 +117,29 @@ class HealthUploadService:
             detail=f"Too many upload requests. Please wait {decision.wait_seconds} seconds before trying again.",
         )
 
-    # Validates file size, coalesces delta uploads, writes tracking row, and enqueues ingest work
-    def enqueue_csv_bytes(
+    # Validates file size, coalesces delta uploads, writes tracking row, and enqueues ingest work.
+    # `upload` is the request's (spooled) file object; it is only read back in full when a task is enqueued.
+    def enqueue_csv_upload(
         self,
         *,
         user_id: str,
-        content: bytes,
+        upload: BinaryIO,
         file_name: str,
         upload_mode: Optional[str] = None,
         seed_batch_id: Optional[str] = None,
         seed_chunk_index: Optional[int] = None,
         seed_chunk_total: Optional[int] = None,
     ) -> UploadCsvResult:
-        if len(content) > self.max_upload_bytes:
-            raise HTTPException(
-                status_code=413,
-                detail=f"Upload too large. Max size is {self.max_upload_bytes} bytes.",
+        content_hash, file_size = self._hash_upload(upload)
+
+        cached_task_id = _completed_get((user_id, content_hash))
+        if cached_task_id is not None:
+            return UploadCsvResult(
+                task_id=cached_task_id,
+                status="completed",
+                message="Data already uploaded and processed",
             )
 
-        content_hash = hashlib.sha256(content).hexdigest()
         now = _utcnow_naive()
 
         existing = tracking_crud.get_by_user_and_hash(self.db, user_id, content_hash)
@@ -113,6 +165,8 @@ class HealthUploadService:
 
             elif existing.status == "completed":
                 self.db.commit()
+                if existing.task_id:
+                    _completed_put((user_id, content_hash), existing.task_id)
                 return UploadCsvResult(
                     task_id=existing.task_id,
                     status="completed",
@@ -121,8 +175,7 @@ class HealthUploadService:
 
             # Reprocess failed/timeout/completed? (Completed already returned above)
             self.enforce_rate_limit(user_id)
-            b64 = base64.b64encode(content).decode("utf-8")
-            task_id = self._enqueue_ingest_task(user_id=user_id, csv_b64=b64)
+            task_id = self._enqueue_ingest_task(user_id=user_id, upload=upload)
             existing.task_id = task_id
             existing.status = "pending"
             existing.updated_at = now
@@ -134,119 +187,157 @@ class HealthUploadService:
         # For frequent delta uploads, coalesce while there is an in-flight ingest for this user.
         # This avoids enqueueing lots of overlapping work when HealthKit fires many observer events.
         if (upload_mode or "").strip().lower() == "delta":
-            inflight = (
-                self.db.query(HealthUploadTracking)
-                .filter(
-                    HealthUploadTracking.user_id == user_id,
-                    HealthUploadTracking.status.in_(["pending", "processing"]),
-                )
-                .order_by(HealthUploadTracking.created_at.desc())
-                .first()
-            )
-            if inflight and inflight.task_id:
+            # Column-only read plus guarded Core UPDATEs: no ORM row is loaded or tracked for this check.
+            inflight_task_id = tracking_crud.get_latest_active_task_id(self.db, user_id=user_id)
+            if inflight_task_id:
                 # If the client isn't polling task status, tracking.status may be stale.
                 # Double-check Celery state and only coalesce if the task is truly still running.
                 try:
-                    st, _ = self._get_ingest_task_state(inflight.task_id)
+                    st, _ = self._get_ingest_task_state(inflight_task_id)
                 except Exception:
                     st = None
 
                 if st in {"SUCCESS", "FAILURE", "REVOKED"}:
                     # Mark tracking terminal based on Celery so delta uploads can enqueue new work.
                     if st == "SUCCESS":
-                        inflight.status = "completed"
-                        inflight.completed_at = _utcnow_naive()
+                        values = {"status": "completed", "completed_at": now, "updated_at": now}
                     else:
-                        inflight.status = "failed"
-                        inflight.error_message = f"Task state={st}"
-                    inflight.updated_at = now
+                        values = {"status": "failed", "error_message": f"Task state={st}", "updated_at": now}
                     try:
+                        tracking_crud.transition_status(
+                            self.db, user_id=user_id, task_id=inflight_task_id, values=values
+                        )
                         self.db.commit()
                     except Exception:
                         self.db.rollback()
                 else:
-                    inflight.request_count = (inflight.request_count or 0) + 1
-                    inflight.updated_at = now
                     try:
+                        tracking_crud.transition_status(
+                            self.db,
+                            user_id=user_id,
+                            task_id=inflight_task_id,
+                            values={"request_count": HealthUploadTracking.request_count + 1, "updated_at": now},
+                        )
                         self.db.commit()
                     except Exception:
                         self.db.rollback()
                     return UploadCsvResult(
-                        task_id=inflight.task_id,
+                        task_id=inflight_task_id,
                         status="processing",
                         message="Delta coalesced: ingest already in progress",
                     )
 
         self.enforce_rate_limit(user_id)
-        b64 = base64.b64encode(content).decode("utf-8")
-        task_id = self._enqueue_ingest_task(user_id=user_id, csv_b64=b64)
-        tracking = HealthUploadTracking(
-            id=content_hash,
-            user_id=user_id,
-            task_id=task_id,
-            file_size=len(content),
-            file_name=file_name,
-            upload_mode=(upload_mode or None),
-            seed_batch_id=(seed_batch_id or None),
-            seed_chunk_index=seed_chunk_index,
-            seed_chunk_total=seed_chunk_total,
-            status="pending",
-            request_count=1,
-        )
-        self.db.add(tracking)
+        # Claim the enqueue before sending the task: a concurrent request for the same file gets this task id
+        # back instead of enqueueing a second full ingest (the upsert below only dedupes the tracking row).
+        task_id = str(uuid.uuid4())  # same form as a Celery-generated id
+        claimed_by = self.enqueue_lock.claim(user_id, content_hash, task_id)
+        if claimed_by is not None:
+            return UploadCsvResult(
+                task_id=claimed_by,
+                status="processing",
+                message="Upload already in progress",
+            )
         try:
-            self.db.commit()
-            return UploadCsvResult(task_id=task_id, status="new")
-        except IntegrityError:
-            self.db.rollback()
-            # Race condition: someone else inserted same (user_id, hash).
-            existing = tracking_crud.get_by_user_and_hash(self.db, user_id, content_hash)
-            if existing:
-                existing.request_count = (existing.request_count or 0) + 1
-                self.db.commit()
-                return UploadCsvResult(
-                    task_id=existing.task_id,
-                    status="processing",
-                    message="Upload already in progress (race condition handled)",
-                )
+            task_id = self._enqueue_ingest_task(user_id=user_id, upload=upload, task_id=task_id)
+        except Exception:
+            self.enqueue_lock.release(user_id, content_hash)
             raise
+        # A concurrent request may have inserted the same (user_id, hash) since the lookup above;
+        # the upsert resolves that in the same round trip instead of failing the commit.
+        stored_task_id, inserted = tracking_crud.insert_or_bump(
+            self.db,
+            values={
+                "id": content_hash,
+                "user_id": user_id,
+                "task_id": task_id,
+                "file_size": file_size,
+                "file_name": file_name,
+                "upload_mode": (upload_mode or None),
+                "seed_batch_id": (seed_batch_id or None),
+                "seed_chunk_index": seed_chunk_index,
+                "seed_chunk_total": seed_chunk_total,
+                "status": "pending",
+                "request_count": 1,
+            },
+        )
+        self.db.commit()
+        if inserted:
+            return UploadCsvResult(task_id=task_id, status="new")
+        return UploadCsvResult(
+            task_id=stored_task_id,
+            status="processing",
+            message="Upload already in progress (race condition handled)",
+        )
 
     # Returns Celery status for a task and reconciles persistent tracking status with task state
     def get_task_status(self, *, user_id: str, task_id: str) -> dict[str, Any]:
         celery_state, celery_result = self._get_ingest_task_state(task_id)
 
-        tracking = tracking_crud.get_by_user_and_task_id(self.db, user_id, task_id)
-        if tracking:
-            if celery_state == "SUCCESS" and tracking.status != "completed":
-                tracking.status = "completed"
-                tracking.completed_at = _utcnow_naive()
-                tracking.updated_at = _utcnow_naive()
-                if isinstance(celery_result, dict):
-                    tracking.row_count = celery_result.get("row_count") or celery_result.get("inserted")
+        # Each transition is a single guarded UPDATE, so a poll that changes nothing costs one no-op statement.
+        if celery_state == "SUCCESS":
+            now = _utcnow_naive()
+            values = {"status": "completed", "completed_at": now, "updated_at": now}
+            if isinstance(celery_result, dict):
+                values["row_count"] = celery_result.get("row_count") or celery_result.get("inserted")
+            row = tracking_crud.transition_status(
+                self.db, user_id=user_id, task_id=task_id, values=values, not_from_statuses=["completed"]
+            )
+            if row is not None:
                 self.db.commit()
-
-            elif celery_state == "FAILURE" and tracking.status not in ["failed", "completed"]:
-                tracking.status = "failed"
-                tracking.error_message = str(celery_result) if celery_result else "Unknown error"
-                tracking.updated_at = _utcnow_naive()
+                _completed_put((user_id, row.id), task_id)
+
+        elif celery_state == "FAILURE":
+            row = tracking_crud.transition_status(
+                self.db,
+                user_id=user_id,
+                task_id=task_id,
+                values={
+                    "status": "failed",
+                    "error_message": str(celery_result) if celery_result else "Unknown error",
+                    "updated_at": _utcnow_naive(),
+                },
+                not_from_statuses=["failed", "completed"],
+            )
+            if row is not None:
                 self.db.commit()
 
-            elif celery_state == "PENDING" and tracking.status == "pending":
-                age_s = (_utcnow_naive() - tracking.created_at).total_seconds() if tracking.created_at else 0
-                if age_s > self.processing_timeout_seconds:
-                    tracking.status = "timeout"
-                    tracking.error_message = f"Task timed out after {age_s}s"
-                    tracking.updated_at = _utcnow_naive()
-                    self.db.commit()
-                    return {"id": task_id, "state": "TIMEOUT", "result": None, "message": "Task timed out"}
-
-            elif celery_state in ["STARTED", "RETRY"] and tracking.status == "pending":
-                tracking.status = "processing"
-                tracking.updated_at = _utcnow_naive()
+        elif celery_state == "PENDING":
+            now = _utcnow_naive()
+            row = tracking_crud.transition_status(
+                self.db,
+                user_id=user_id,
+                task_id=task_id,
+                values={"status": "timeout", "updated_at": now},
+                from_statuses=["pending"],
+                created_before=now - timedelta(seconds=self.processing_timeout_seconds),
+            )
+            if row is not None:
+                age_s = (now - row.created_at).total_seconds()
+                # error_message needs the age, which only the matched row knows (one extra statement, timeout path only)
+                tracking_crud.transition_status(
+                    self.db,
+                    user_id=user_id,
+                    task_id=task_id,
+                    values={"error_message": f"Task timed out after {age_s}s"},
+                )
+                self.db.commit()
+                return {"id": task_id, "state": "TIMEOUT", "result": None, "message": "Task timed out"}
+
+        elif celery_state in ["STARTED", "RETRY"]:
+            row = tracking_crud.transition_status(
+                self.db,
+                user_id=user_id,
+                task_id=task_id,
+                values={"status": "processing", "updated_at": _utcnow_naive()},
+                from_statuses=["pending"],
+            )
+            if row is not None:
                 self.db.commit()
 
         return {"id": task_id, "state": celery_state, "result": celery_result}
 
+    # Timestamps are left as datetimes; the route serializes with orjson, which writes the same ISO strings
     def get_seed_status(self, *, user_id: str, batch_id: Optional[str] = None, limit: int = 200) -> dict[str, Any]:
         bid = batch_id or tracking_crud.get_latest_seed_batch_id(self.db, user_id=user_id)
         if not bid:
@@ -275,9 +366,9 @@ class HealthUploadService:
                     "status": r.status,
                     "file_size": r.file_size,
                     "row_count": r.row_count,
-                    "created_at": r.created_at.isoformat() if r.created_at else None,
-                    "updated_at": r.updated_at.isoformat() if r.updated_at else None,
-                    "completed_at": r.completed_at.isoformat() if r.completed_at else None,
+                    "created_at": r.created_at,
+                    "updated_at": r.updated_at,
+                    "completed_at": r.completed_at,
                     "error_message": r.error_message,
                 }
             )
@@ -34,3 +34,26 @@ def get_async_openai_compatible_client(provider: Optional[str], *, default_opena
     return AsyncOpenAI(**kwargs)
 
 
+# Long-lived clients, one per provider, so their HTTP connection pools (and TLS sessions) are reused across requests
+_SHARED_CLIENTS: Dict[str, AsyncOpenAI] = {}
+
+
+# Return the process-wide client for a provider, creating it on first use
+def get_shared_async_openai_compatible_client(provider: Optional[str]) -> AsyncOpenAI:
+    provider_l = (provider or "openai").strip().lower()
+    client = _SHARED_CLIENTS.get(provider_l)
+    if client is None:
+        client = get_async_openai_compatible_client(provider_l)
+        _SHARED_CLIENTS[provider_l] = client
+    return client
+
+
+# Close every shared client (called from the app lifespan on shutdown)
+async def close_shared_async_openai_compatible_clients() -> None:
+    clients = list(_SHARED_CLIENTS.values())
+    _SHARED_CLIENTS.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception:
+            pass
@@ -6,6 +6,35 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# Sanitizer rewrite patterns (compiled at import so a bad pattern fails fast, not per query)
+_RE_HAVING = re.compile(r"(?is)\bhaving\b")
+_RE_GROUP_BY = re.compile(r"(?is)\bgroup\s+by\b")
+# First ORDER BY / LIMIT after a HAVING condition (end of the condition to hoist)
+_RE_HAVING_END = re.compile(r"(?is)\b(?:order\s+by|limit)\b")
+_RE_INT_CAST = re.compile(r"::\s*(int|integer)\b", re.IGNORECASE)
+_RE_AT_TIME_ZONE_JSON = re.compile(r"(?is)\bat\s+time\s+zone\s+([a-zA-Z_][\w]*\.[a-zA-Z_]\w*)\s*->>\s*'([^']+)'")
+_RE_IDENT = re.compile(r"[a-zA-Z_]\w*")
+_RE_LEADING_WITH = re.compile(r"(?is)^\s*with\b")
+_RE_SELECT = re.compile(r"(?is)\bselect\b")
+# Bind names, skipping PG casts like ::date
+_RE_BIND_NAME = re.compile(r"(?is)(?<!:):([a-zA-Z_]\w*)\b")
+_RE_WHERE_USER = re.compile(r"(?is)\b([a-zA-Z_][\w]*\.)?user_id\s*=\s*:user_id\b")
+_RE_FORBIDDEN = re.compile(r"(?is)\b(insert|update|delete|drop|alter|create|truncate|grant|revoke)\b")
+
+
+# Matches FROM/JOIN of the given table
+def _re_from_table(table: str) -> "re.Pattern[str]":
+    return re.compile(rf"(?is)\b(from|join)\s+{table}\b")
+
+
+_RE_FROM_ROLLUP_HOURLY = _re_from_table("derived_rollup_hourly")
+_RE_FROM_ROLLUP_DAILY = _re_from_table("derived_rollup_daily")
+_RE_FROM_WORKOUT_SEGMENTS = _re_from_table("derived_workout_segments")
+_RE_FROM_WORKOUTS = _re_from_table("derived_workouts")
+_RE_FROM_SLEEP_DAILY = _re_from_table("derived_sleep_daily")
+_RE_FROM_MAIN_METRICS = _re_from_table("main_health_metrics")
+_RE_FROM_MAIN_EVENTS = _re_from_table("main_health_events")
+
 
 # Return SQL with string literals and comments replaced by whitespace
 def _strip_sql_strings_and_comments(sql: object) -> str:
@@ -222,7 +251,7 @@ def _parse_cte_names(sql_stripped: object) -> set[str]:
                 pos += 1
             return None, pos
 
-        m = re.match(r"[a-zA-Z_]\w*", s[pos:])
+        m = _RE_IDENT.match(s, pos)
         if not m:
             return None, pos
         name = m.group(0)
@@ -311,7 +340,7 @@ def _validate_sql_sources(sql: str, allowed_sources: set[str], health_sources: s
 def _rewrite_rollup_hourly_to_tz_derived(sql: str) -> str:
     try:
         stripped = _strip_sql_strings_and_comments(sql)
-        if not re.search(r"(?is)\b(from|join)\s+derived_rollup_hourly\b", stripped):
+        if not _RE_FROM_ROLLUP_HOURLY.search(stripped):
             return sql
 
         hourly_subquery = (
@@ -370,7 +399,7 @@ def _rewrite_rollup_hourly_to_tz_derived(sql: str) -> str:
 def _rewrite_rollup_daily_to_tz_derived(sql: str) -> str:
     try:
         stripped = _strip_sql_strings_and_comments(sql)
-        if not re.search(r"(?is)\b(from|join)\s+derived_rollup_daily\b", stripped):
+        if not _RE_FROM_ROLLUP_DAILY.search(stripped):
             return sql
 
         daily_subquery = (
@@ -428,7 +457,7 @@ def _rewrite_rollup_daily_to_tz_derived(sql: str) -> str:
 def _rewrite_derived_workout_segments_to_user_scoped(sql: str) -> str:
     try:
         stripped = _strip_sql_strings_and_comments(sql)
-        if not re.search(r"(?is)\b(from|join)\s+derived_workout_segments\b", stripped):
+        if not _RE_FROM_WORKOUT_SEGMENTS.search(stripped):
             return sql
 
         seg_subquery = (
@@ -475,7 +504,7 @@ def _rewrite_derived_workout_segments_to_user_scoped(sql: str) -> str:
 def _rewrite_derived_workouts_to_user_scoped(sql: str) -> str:
     try:
         stripped = _strip_sql_strings_and_comments(sql)
-        if not re.search(r"(?is)\b(from|join)\s+derived_workouts\b", stripped):
+        if not _RE_FROM_WORKOUTS.search(stripped):
             return sql
 
         w_subquery = (
@@ -522,7 +551,7 @@ def _rewrite_derived_workouts_to_user_scoped(sql: str) -> str:
 def _rewrite_derived_sleep_daily_to_user_scoped(sql: str) -> str:
     try:
         stripped = _strip_sql_strings_and_comments(sql)
-        if not re.search(r"(?is)\b(from|join)\s+derived_sleep_daily\b", stripped):
+        if not _RE_FROM_SLEEP_DAILY.search(stripped):
             return sql
 
         subquery = (
@@ -573,19 +602,20 @@ def _extract_sql_from_text(text: object) -> str:
     # Drop fenced blocks
     s = text.strip()
     if s.startswith("```"):
-        lines = s.splitlines()
-        if lines:
-            lines = lines[1:]
-        if lines and lines[-1].strip().startswith("```"):
-            lines = lines[:-1]
-        s = "\n".join(lines).strip()
+        # Drop the opening fence line and everything from the closing fence on, without splitting lines.
+        nl = s.find("\n")
+        s = s[nl + 1:] if nl >= 0 else ""
+        end = s.rfind("```")
+        if end >= 0:
+            s = s[:end]
+        s = s.strip()
 
     # Keep from the first top-level keyword start: WITH or SELECT
-    m_with = re.search(r"(?is)^\s*with\b", s)
+    m_with = _RE_LEADING_WITH.search(s)
     if m_with:
         s = s[m_with.start():]
     else:
-        m_select = re.search(r"(?is)\bselect\b", s)
+        m_select = _RE_SELECT.search(s)
         if m_select:
             s = s[m_select.start():]
     return s.strip()
@@ -601,7 +631,7 @@ def _sanitize_sql(sql: str) -> str:
     stripped = _strip_sql_strings_and_comments(s)
 
     # Only allow :user_id and :tz_name binds (avoid matching PG casts like ::date)
-    bind_names = set(re.findall(r"(?is)(?<!:):([a-zA-Z_]\w*)\b", stripped))
+    bind_names = set(_RE_BIND_NAME.findall(stripped))
     unknown_binds = sorted([b for b in bind_names if b.lower() not in {"user_id", "tz_name"}])
     if unknown_binds:
         raise ValueError(f"Unsupported bind parameters: {', '.join(unknown_binds)}")
@@ -665,8 +695,10 @@ def _sanitize_sql(sql: str) -> str:
     if has_semicolon_outside:
         raise ValueError("Multiple statements are not allowed")
 
-    clause_starts = [pos for pos in [group_idx, order_idx, limit_idx] if pos >= 0]
-    next_clause_start = min(clause_starts) if clause_starts else len(s)
+    next_clause_start = len(s)
+    for pos in (group_idx, order_idx, limit_idx):
+        if 0 <= pos < next_clause_start:
+            next_clause_start = pos
 
     stripped = _strip_sql_strings_and_comments(s)
 
@@ -684,7 +716,7 @@ def _sanitize_sql(sql: str) -> str:
         if where_idx >= 0:
             where_body = s[where_idx:next_clause_start]
             where_body_stripped = _strip_sql_strings_and_comments(where_body)
-            has_where_user = bool(re.search(r"(?is)\b([a-zA-Z_][\w]*\.)?user_id\s*=\s*:user_id\b", where_body_stripped))
+            has_where_user = bool(_RE_WHERE_USER.search(where_body_stripped))
             if not has_where_user and not has_join_scoped_user:
                 where_keyword_end = where_idx + len("where")
                 s = s[:where_keyword_end] + " user_id = :user_id AND " + s[where_keyword_end:]
@@ -693,50 +725,33 @@ def _sanitize_sql(sql: str) -> str:
                 insert_pos = next_clause_start
                 s = s[:insert_pos] + " WHERE user_id = :user_id " + s[insert_pos:]
 
-    try:
-        m_having = re.search(r"(?is)\bhaving\b", s)
-        if m_having:
-            m_group_any = re.search(r"(?is)\bgroup\s+by\b", s)
-            if not m_group_any:
-                start_cond = m_having.end()
-                m_order_after = re.search(r"(?is)\border\s+by\b", s[start_cond:])
-                m_limit_after = re.search(r"(?is)\blimit\b", s[start_cond:])
-                end_cond_candidates = []
-                if m_order_after:
-                    end_cond_candidates.append(start_cond + m_order_after.start())
-                if m_limit_after:
-                    end_cond_candidates.append(start_cond + m_limit_after.start())
-                end_cond = min(end_cond_candidates) if end_cond_candidates else len(s)
-                having_condition = s[start_cond:end_cond].strip()
-                base_sql = s[:m_having.start()].rstrip()
-                trailing_clauses = s[end_cond:]
-                s = f"SELECT * FROM ({base_sql}) AS sub WHERE {having_condition} {trailing_clauses}"
-    except Exception:
-        pass
+    # HAVING without GROUP BY: hoist the condition into a WHERE over a subquery.
+    m_having = _RE_HAVING.search(s)
+    if m_having and not _RE_GROUP_BY.search(s):
+        start_cond = m_having.end()
+        m_end = _RE_HAVING_END.search(s, start_cond)
+        end_cond = m_end.start() if m_end else len(s)
+        having_condition = s[start_cond:end_cond].strip()
+        base_sql = s[:m_having.start()].rstrip()
+        trailing_clauses = s[end_cond:]
+        s = f"SELECT * FROM ({base_sql}) AS sub WHERE {having_condition} {trailing_clauses}"
 
     # JSON numeric strings may include decimals; ::int can fail in generated SQL.
-    s = re.sub(r"::\s*(int|integer)\b", "::float", s, flags=re.IGNORECASE)
+    s = _RE_INT_CAST.sub("::float", s)
 
     # Fix common operator-precedence bug in generated SQL:
     # "ts AT TIME ZONE x.meta ->> 'tz_name'" is parsed as (ts AT TIME ZONE x.meta) ->> 'tz_name',
     # which calls timezone(jsonb, timestamptz) and fails. Parenthesize the JSON extraction.
-    try:
-        s = re.sub(
-            r"(?is)\bat\s+time\s+zone\s+([a-zA-Z_][\w]*\.[a-zA-Z_]\w*)\s*->>\s*'([^']+)'",
-            r"AT TIME ZONE (\1->>'\2')",
-            s,
-        )
-    except Exception:
-        pass
+    s = _RE_AT_TIME_ZONE_JSON.sub(r"AT TIME ZONE (\1->>'\2')", s)
 
     # Block direct queries to the raw metrics table (keep the tool limited to events + rollups).
     stripped_final = _strip_sql_strings_and_comments(s)
-    if re.search(r"\b(from|join)\s+main_health_metrics\b", stripped_final, flags=re.IGNORECASE):
+    if _RE_FROM_MAIN_METRICS.search(stripped_final):
         raise ValueError("Raw metrics table is not available; use derived_rollup_hourly and/or derived_rollup_daily")
-    if re.search(r"\b(from|join)\s+main_health_events\b", stripped_final, flags=re.IGNORECASE):
+    if _RE_FROM_MAIN_EVENTS.search(stripped_final):
         raise ValueError("Raw events table is not available; use derived_workouts and/or derived_workout_segments")
 
-    if re.search(r"(?is)\b(insert|update|delete|drop|alter|create|truncate|grant|revoke)\b", stripped_final):
+    if _RE_FORBIDDEN.search(stripped_final):
         raise ValueError("Forbidden tokens in SQL")
 
     return s
\ No newline at end of file
@@ -1,16 +1,205 @@
 import asyncio
+import hashlib
 import logging
 import pathlib
-from datetime import timezone
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
 from sqlalchemy import bindparam, text
 from zoneinfo import ZoneInfo
 
-from Backend.database import SessionLocal
-from Backend.services.openai_compatible_client import get_async_openai_compatible_client
+from Backend.database import AsyncSessionLocal, async_engine
+from Backend.health_data_version import get_health_data_version
+from Backend.services.openai_compatible_client import get_shared_async_openai_compatible_client
 from Backend.services.sql_gen import _extract_sql_from_text, _sanitize_sql
 
 logger = logging.getLogger(__name__)
 _BACKEND_DIR = pathlib.Path(__file__).resolve().parents[2]
+_SQL_SYSTEM_PROMPT = (_BACKEND_DIR / "resources" / "sql_prompt.txt").read_text(encoding="utf-8")
+_UTC = timezone.utc
+_EVENT_TS_KEYS = ("workout_ts", "workout_timestamp", "timestamp")
+_WORKOUT_TS_KEYS = ("start_ts", "end_ts", "workout_start_ts")
+_SLEEP_TS_KEYS = ("sleep_start_ts", "sleep_end_ts")
+# Columns localize_health_rows formats as display timestamps / ISO dates.
+_LOCAL_TS_KEYS = ("timestamp", "start_ts", "end_ts", "bucket_ts", "workout_ts", "workout_timestamp")
+_LOCAL_DATE_KEYS = ("date", "day", "start_date", "end_date")
+_LOCAL_COLS = frozenset(_LOCAL_TS_KEYS + _LOCAL_DATE_KEYS)
+# Display format for timestamps; _fmt_local is the hand-rolled equivalent for single values.
+_TS_FMT = "%Y-%m-%d %I:%M %p"
+# Every column a rewrite pass can reformat; results without any of them skip the rewriters entirely.
+_REWRITE_COLS = frozenset(_EVENT_TS_KEYS + _WORKOUT_TS_KEYS + ("bucket_ts",) + _SLEEP_TS_KEYS)
+# Per-segment columns; a row carrying any of them is a workout segment, whose start_ts is not the workout start_ts.
+_SEGMENT_COLS = frozenset(("segment_index", "segment_unit", "pace_s_per_unit", "start_offset_min", "end_offset_min"))
+
+# The tool only reads; read-only transactions let Postgres skip write bookkeeping (and refuse stray writes).
+# Statement compilation is already cached by the engine's LRU compiled cache, so no per-connection cache is set.
+_READONLY_TXN = {"postgresql_readonly": True}
+
+# Recently resolved per-row timezones, shared across requests: key = (kind, user_id, *lookup key) -> (stored_at, tz).
+# Follow-up questions in a chat tend to hit the same buckets/workouts; misses are cached too (as None).
+# Entries carry the user's health-data version, so anything resolved before an ingest (including a "not
+# found" for a row that has since landed) stops matching once that ingest completes.
+_META_TZ_CACHE: "OrderedDict[tuple, tuple[float, str, str | None]]" = OrderedDict()
+_META_TZ_TTL_SECONDS: int = 300
+_META_TZ_MAX_ENTRIES: int = 10_000
+_MISS = object()
+
+# Rows fetched per round trip from the server-side cursor for the generated query
+_SQL_FETCH_CHUNK = 500
+# Hard cap on rows returned to the model; the cursor is abandoned once it is reached
+_SQL_MAX_ROWS = 5_000
+
+# Sanitized SQL per normalized question, so repeat questions skip the LLM call and sanitizer.
+# The SQL only references :user_id/:tz_name binds, so one entry serves every user.
+_SQL_CACHE: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+_SQL_CACHE_TTL_SECONDS: int = 3600
+_SQL_CACHE_MAX_ENTRIES: int = 1_000
+
+# Executed results per (user_id, question key, tz_name), so a question repeated within a minute skips the
+# LLM call and the query too. Entries are stamped with the user's health-data version and miss once an
+# ingest for that user completes (see Backend.health_data_version).
+_SQL_RESULT_CACHE: "OrderedDict[tuple[str, str, str], tuple[float, str, dict]]" = OrderedDict()
+_SQL_RESULT_TTL_SECONDS: int = 60
+_SQL_RESULT_MAX_ENTRIES: int = 2_048
+
+
+# A shared execute_sql_gen_tool call and how many callers are awaiting it
+@dataclass
+class _InFlight:
+    task: "asyncio.Task[dict]"
+    waiters: int = 0
+
+
+_SQL_INFLIGHT: dict[tuple[str, str, str], _InFlight] = {}
+
+# Timezone lookup statements for the rewriters, built once so SQLAlchemy can reuse its compiled form.
+_Q_EVENT_META = text(
+    """
+    SELECT timestamp, hk_metadata
+    FROM main_health_events
+    WHERE user_id = :user_id
+      AND timestamp = ANY(CAST(:ts_vals AS timestamptz[]))
+      AND event_type LIKE 'workout_%'
+    """
+)
+_Q_WORKOUT_META = text(
+    """
+    SELECT workout_uuid, start_ts, hk_metadata
+    FROM derived_workouts
+    WHERE user_id = :user_id
+      AND (workout_uuid IN :uuids OR start_ts IN :starts)
+    """
+).bindparams(bindparam("uuids", expanding=True), bindparam("starts", expanding=True))
+# One row per requested (bucket_ts, metric_type) pair: hourly meta when an hourly row exists, else daily
+# (restored in mirror mode). A NULL metric_type matches any metric at that bucket.
+_Q_ROLLUP_META = text(
+    """
+    SELECT v.ts AS bucket_ts, v.mt AS metric_type, COALESCE(h.meta, d.meta) AS meta
+    FROM unnest(CAST(:pair_ts AS timestamptz[]), CAST(:pair_mts AS text[])) AS v(ts, mt)
+    LEFT JOIN LATERAL (
+      SELECT meta, TRUE AS found
+      FROM derived_rollup_hourly
+      WHERE user_id = :user_id
+        AND bucket_ts = v.ts
+        AND (v.mt IS NULL OR metric_type = v.mt)
+      LIMIT 1
+    ) h ON TRUE
+    LEFT JOIN LATERAL (
+      SELECT meta
+      FROM derived_rollup_daily
+      WHERE user_id = :user_id
+        AND bucket_ts = v.ts
+        AND (v.mt IS NULL OR metric_type = v.mt)
+        AND h.found IS NULL
+      LIMIT 1
+    ) d ON TRUE
+    """
+)
+_Q_SLEEP_META = text(
+    """
+    SELECT sleep_date, meta
+    FROM derived_sleep_daily
+    WHERE user_id = :user_id
+      AND sleep_date = ANY(:sleep_dates)
+    """
+)
+
+
+# Cached ZoneInfo per IANA name so per-row formatting doesn't re-resolve tzdata.
+# Invalid names cache as None too; otherwise every row carrying a bad tz name would retry the tzdata lookup.
+@lru_cache(maxsize=256)
+def _zi(name: str) -> ZoneInfo | None:
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return None
+
+
+# Resolve the request timezone once per rewrite pass (UTC if the name is invalid)
+def _request_zone(request_tz: str):
+    try:
+        return _zi(request_tz) or _UTC
+    except Exception:
+        return _UTC
+
+
+# Equivalent of strftime("%Y-%m-%d %I:%M %p") without going through the strftime format parser
+def _fmt_local(dt) -> str:
+    h = dt.hour
+    ap = "AM" if h < 12 else "PM"
+    h12 = h % 12 or 12
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {h12:02d}:{dt.minute:02d} {ap}"
+
+
+# Below this many values, per-value formatting beats the pandas setup cost
+_VECTOR_FMT_MIN = 32
+
+
+# Format many datetimes into one zone (naive values are taken as UTC), vectorized via pandas for large batches.
+# Values that can't be converted are returned unchanged.
+def _fmt_local_many(values: list[datetime], zone) -> list[object]:
+    if len(values) >= _VECTOR_FMT_MIN:
+        try:
+            import pandas as pd
+
+            idx = pd.to_datetime(values, utc=True).tz_convert(zone)
+            return idx.strftime(_TS_FMT).tolist()
+        except Exception:
+            pass
+    out: list[object] = []
+    for v in values:
+        try:
+            out.append(_fmt_local((v if v.tzinfo is not None else v.replace(tzinfo=_UTC)).astimezone(zone)))
+        except Exception:
+            out.append(v)
+    return out
+
+
+# Format an aware datetime in its recorded timezone when valid, else in the request zone
+def _format_in_tz(dt, tzv: str | None, req_zone) -> tuple[str, str | None]:
+    try:
+        zone = _zi(tzv) if tzv else None
+        if zone is not None:
+            return _fmt_local(dt.astimezone(zone)), tzv
+    except Exception:
+        pass
+    return _fmt_local(dt.astimezone(req_zone)), None
+
+
+# _format_in_tz memoized per (instant, tz name) for one rewrite; result sets repeat the same buckets/timestamps a lot
+def _cached_tz_formatter(req_zone):
+    cache: dict[tuple[object, str | None], tuple[str, str | None]] = {}
+
+    def fmt(dt, tzv: str | None) -> tuple[str, str | None]:
+        key = (dt, tzv)
+        hit = cache.get(key)
+        if hit is None:
+            hit = cache[key] = _format_in_tz(dt, tzv, req_zone)
+        return hit
+
+    return fmt
 
 
 TOOL_SPEC = {
@@ -27,514 +216,661 @@ TOOL_SPEC = {
 }
 
 
-# Generates SQL text via Gemini, sanitizes it, executes it, and returns db rows
-async def execute_sql_gen_tool(*, user_id: str, question: str, tz_name: str) -> dict:
-    sql_system_path = _BACKEND_DIR / "resources" / "sql_prompt.txt"
+# Log argument that escapes newlines only when the record is actually formatted (single-line logs)
+class _nl:
+    __slots__ = ("s",)
 
-    sql_system_prompt = sql_system_path.read_text(encoding="utf-8")
-    question_text = question
+    def __init__(self, s: str):
+        self.s = s
 
-    logger.info("sql.gen.start: question='%s' model=%s", question, "gemini-2.5-flash-lite")
+    def __str__(self) -> str:
+        return self.s.replace("\n", "\\n")
 
-    client = get_async_openai_compatible_client("gemini")
+
+# Opens (and returns to the pool) a DB connection so connect/auth overlaps the LLM call
+async def _prewarm_db() -> None:
     try:
-        sql_resp = await client.chat.completions.create(
+        async with async_engine.connect():
+            pass
+    except Exception:
+        logger.debug("sql.exec.prewarm_failed", exc_info=True)
+
+
+def _sql_cache_key(question: str) -> str:
+    normalized = " ".join(question.lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _sql_cache_get(key: str) -> str | None:
+    hit = _SQL_CACHE.get(key)
+    if hit is None:
+        return None
+    stored_at, sql = hit
+    if time.monotonic() - stored_at >= _SQL_CACHE_TTL_SECONDS:
+        _SQL_CACHE.pop(key, None)
+        return None
+    _SQL_CACHE.move_to_end(key)
+    return sql
+
+
+def _sql_cache_put(key: str, sql: str) -> None:
+    _SQL_CACHE[key] = (time.monotonic(), sql)
+    _SQL_CACHE.move_to_end(key)
+    while len(_SQL_CACHE) > _SQL_CACHE_MAX_ENTRIES:
+        _SQL_CACHE.popitem(last=False)
+
+
+def _sql_result_get(key: tuple[str, str, str], data_version: str) -> dict | None:
+    hit = _SQL_RESULT_CACHE.get(key)
+    if hit is None:
+        return None
+    stored_at, stored_version, sql_out = hit
+    if stored_version != data_version or time.monotonic() - stored_at >= _SQL_RESULT_TTL_SECONDS:
+        _SQL_RESULT_CACHE.pop(key, None)
+        return None
+    _SQL_RESULT_CACHE.move_to_end(key)
+    return sql_out
+
+
+# sql_out is the shared task's result, which callers only ever receive copies of, so it is stored as-is
+def _sql_result_put(key: tuple[str, str, str], data_version: str, sql_out: dict) -> None:
+    _SQL_RESULT_CACHE[key] = (time.monotonic(), data_version, sql_out)
+    _SQL_RESULT_CACHE.move_to_end(key)
+    while len(_SQL_RESULT_CACHE) > _SQL_RESULT_MAX_ENTRIES:
+        _SQL_RESULT_CACHE.popitem(last=False)
+
+
+# Fresh row dicts per caller, since callers replace and edit rows
+def _copy_sql_out(sql_out: dict) -> dict:
+    rows = sql_out.get("rows")
+    if not isinstance(rows, list):
+        return dict(sql_out)
+    return {**sql_out, "rows": [dict(r) for r in rows]}
+
+
+# Generates SQL text via Gemini and sanitizes it; returns (safe_sql, None) or (None, error payload)
+async def _generate_safe_sql(question: str) -> tuple[str | None, dict | None]:
+    logger.info("sql.gen.start: question='%s' model=%s", question, "gemini-2.5-flash-lite")
+
+    client = get_shared_async_openai_compatible_client("gemini")
+    sql_resp, _ = await asyncio.gather(
+        client.chat.completions.create(
             model="gemini-2.5-flash-lite",
             messages=[
-                {"role": "system", "content": sql_system_prompt},
-                {"role": "user", "content": question_text},
+                {"role": "system", "content": _SQL_SYSTEM_PROMPT},
+                {"role": "user", "content": question},
             ],
             temperature=0,
-        )
-        sql_text = sql_resp.choices[0].message.content if sql_resp.choices else ""
-    finally:
-        try:
-            await client.close()
-        except Exception:
-            pass
+        ),
+        _prewarm_db(),
+    )
+    sql_text = sql_resp.choices[0].message.content if sql_resp.choices else ""
     if not isinstance(sql_text, str) or not sql_text.strip():
         logger.warning("sql.gen.empty: question='%s'", question)
-        return {"sql": {"sql": None, "rows": [], "error": "no-sql"}}
+        return None, {"sql": {"sql": None, "rows": [], "error": "no-sql"}}
 
     try:
         extracted = _extract_sql_from_text(sql_text)
         # Log as a single line to avoid multi-process interleaving under gunicorn.
-        logger.info("sql.gen.sql.extracted: %s", extracted.replace("\n", "\\n"))
+        logger.info("sql.gen.sql.extracted: %s", _nl(extracted))
         safe_sql = _sanitize_sql(extracted)
-        logger.info("sql.gen.sql.sanitized: %s", safe_sql.replace("\n", "\\n"))
+        logger.info("sql.gen.sql.sanitized: %s", _nl(safe_sql))
     except Exception as e:
         logger.exception("sql.gen.error: question='%s' error=%s", question, str(e))
-        try:
-            logger.info("sql.gen.sql.raw: %s", str(sql_text).replace("\n", "\\n"))
-        except Exception:
-            pass
-        return {"sql": {"sql": sql_text, "rows": [], "error": f"invalid-sql: {e}"}}
+        logger.info("sql.gen.sql.raw: %s", _nl(sql_text))
+        return None, {"sql": {"sql": sql_text, "rows": [], "error": f"invalid-sql: {e}"}}
+    return safe_sql, None
 
-    loop = asyncio.get_running_loop()
 
-    def execute_sql():
-        with SessionLocal() as session:
-            try:
-                result = session.execute(text(safe_sql), {"user_id": user_id, "tz_name": tz_name}).mappings().all()
-                rows = [dict(r) for r in result]
-
-                # Post-processing: keep output travel-proof by formatting timestamps in the timezone active when recorded.
-                try:
-                    _rewrite_event_timestamps_inplace(session=session, user_id=user_id, rows=rows, request_tz=tz_name)
-                except Exception:
-                    pass
-                try:
-                    _rewrite_workout_timestamps_inplace(session=session, user_id=user_id, rows=rows, request_tz=tz_name)
-                except Exception:
-                    pass
-                try:
-                    _rewrite_rollup_bucket_ts_inplace(session=session, user_id=user_id, rows=rows, request_tz=tz_name)
-                except Exception:
-                    pass
-                try:
-                    _rewrite_sleep_daily_timestamps_inplace(session=session, user_id=user_id, rows=rows, request_tz=tz_name)
-                except Exception:
-                    pass
+# Generates SQL text via Gemini (or reuses it for a repeat question), executes it, and returns db rows
+async def execute_sql_gen_tool(*, user_id: str, question: str, tz_name: str) -> dict:
+    cache_key = _sql_cache_key(question)
+    result_key = (user_id, cache_key, tz_name)
+    # The user's health-data version (None if Redis is unreachable, which disables the result cache).
+    # Only a cached entry has to wait for it; on a miss the read overlaps SQL generation instead.
+    version_task = asyncio.create_task(get_health_data_version(user_id))
+    if result_key in _SQL_RESULT_CACHE:
+        data_version = await version_task
+        cached = _sql_result_get(result_key, data_version) if data_version is not None else None
+        if cached is not None:
+            logger.info("sql.result.cache_hit: question='%s'", question)
+            return {"sql": _copy_sql_out(cached)}
+
+    # Identical calls already in flight (a retry, a second tab) share one LLM call + query.
+    flight = _SQL_INFLIGHT.get(result_key)
+    if flight is None:
+        flight = _InFlight(asyncio.create_task(_run_sql_gen_tool(
+            user_id=user_id,
+            question=question,
+            tz_name=tz_name,
+            cache_key=cache_key,
+            result_key=result_key,
+            version_task=version_task,
+        )))
+        _SQL_INFLIGHT[result_key] = flight
+        flight.task.add_done_callback(lambda _t: _SQL_INFLIGHT.pop(result_key, None))
+    else:
+        version_task.cancel()
+        logger.info("sql.gen.coalesced: question='%s'", question)
+
+    flight.waiters += 1
+    try:
+        res = await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        # The last waiter to go away takes the shared call down with it.
+        if flight.waiters == 1:
+            flight.task.cancel()
+        raise
+    finally:
+        flight.waiters -= 1
+    sql_out = res.get("sql")
+    if isinstance(sql_out, dict):
+        return {**res, "sql": _copy_sql_out(sql_out)}
+    return res
+
+
+async def _run_sql_gen_tool(
+    *,
+    user_id: str,
+    question: str,
+    tz_name: str,
+    cache_key: str,
+    result_key: tuple[str, str, str],
+    version_task: "asyncio.Task[str | None]",
+) -> dict:
+    try:
+        return await _generate_and_execute_sql(
+            user_id=user_id,
+            question=question,
+            tz_name=tz_name,
+            cache_key=cache_key,
+            result_key=result_key,
+            version_task=version_task,
+        )
+    finally:
+        # Early exits (invalid SQL, cancellation) never await the version read.
+        if not version_task.done():
+            version_task.cancel()
+
+
+async def _generate_and_execute_sql(
+    *,
+    user_id: str,
+    question: str,
+    tz_name: str,
+    cache_key: str,
+    result_key: tuple[str, str, str],
+    version_task: "asyncio.Task[str | None]",
+) -> dict:
+    safe_sql = _sql_cache_get(cache_key)
+    fresh = safe_sql is None
+    if fresh:
+        safe_sql, err = await _generate_safe_sql(question)
+        if err is not None:
+            return err
+    else:
+        logger.info("sql.gen.cache_hit: question='%s'", question)
+
+    # Resolved before the query runs (normally long done by now), so a result that races an ingest is
+    # stamped with the older version.
+    data_version = await version_task
 
-                if not rows:
-                    logger.warning("sql.exec.empty: question='%s' sql=%s", question, safe_sql.replace("\n", "\\n"))
-                return {"sql": safe_sql, "rows": rows}
-            except Exception as e:
-                logger.exception(
-                    "sql.exec.error: question='%s' error=%s sql=%s",
-                    question,
-                    str(e),
-                    safe_sql.replace("\n", "\\n"),
-                )
-                return {"sql": safe_sql, "rows": [], "error": str(e)}
-
-    sql_out = await loop.run_in_executor(None, execute_sql)
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.connection(execution_options=_READONLY_TXN)
+            # Build mutable dicts straight off the cursor (the rewriters below edit rows in place),
+            # zipping plain rows against one shared key list instead of going through RowMapping.
+            # Server-side cursor fetched in chunks, so large results aren't buffered whole before being copied.
+            result = await session.stream(
+                text(safe_sql),
+                {"user_id": user_id, "tz_name": tz_name},
+                execution_options={"yield_per": _SQL_FETCH_CHUNK},
+            )
+            keys = list(result.keys())
+            rows = []
+            truncated = False
+            async for chunk in result.partitions():
+                rows.extend(dict(zip(keys, r)) for r in chunk)
+                if len(rows) > _SQL_MAX_ROWS:
+                    # Stop pulling from the cursor; closing the session discards the rest server-side.
+                    del rows[_SQL_MAX_ROWS:]
+                    truncated = True
+                    break
+
+        # Post-processing: keep output travel-proof by formatting timestamps in the timezone active when recorded.
+        # Runs after the query session is released; the lookups check out their own sessions.
+        if not _REWRITE_COLS.isdisjoint(keys):
+            await _rewrite_timestamps_inplace(
+                user_id=user_id, rows=rows, request_tz=tz_name, columns=keys, data_version=data_version
+            )
+
+        if not rows:
+            logger.warning("sql.exec.empty: question='%s' sql=%s", question, _nl(safe_sql))
+        # Only SQL that ran cleanly is reused.
+        if fresh:
+            _sql_cache_put(cache_key, safe_sql)
+        sql_out = {"sql": safe_sql, "rows": rows}
+        if truncated:
+            logger.warning("sql.exec.truncated: question='%s' max_rows=%d", question, _SQL_MAX_ROWS)
+            sql_out["truncated"] = True
+        if data_version is not None:
+            _sql_result_put(result_key, data_version, sql_out)
+    except Exception as e:
+        logger.exception(
+            "sql.exec.error: question='%s' error=%s sql=%s",
+            question,
+            str(e),
+            _nl(safe_sql),
+        )
+        sql_out = {"sql": safe_sql, "rows": [], "error": str(e)}
     return {"sql": sql_out}
 
 
-# Convert SQL UTC-default timestamps to user's current timezone
-def localize_health_rows(rows: list[dict], tz: str) -> list[dict]:
-    try:
-        zone = ZoneInfo(tz)
-    except Exception:
-        zone = ZoneInfo("UTC")
-
-    out: list[dict] = []
-    for r in rows:
-        rr = dict(r)
-        # Localize any timestamp-like fields into the user's current timezone for display.
-        # Note: workout timestamps may be further rewritten upstream using per-event timezone in main_health_events.hk_metadata (HKTimeZone).
-        for key in ("timestamp", "start_ts", "end_ts", "bucket_ts", "workout_ts", "workout_timestamp"):
-            if key in rr and rr[key]:
-                dt = rr[key]
-                try:
-                    # If already formatted as a string upstream, leave as-is.
-                    if isinstance(dt, str):
-                        continue
-                    if getattr(dt, "tzinfo", None) is None:
-                        dt = dt.replace(tzinfo=timezone.utc)
-                    rr[key] = dt.astimezone(zone).strftime("%Y-%m-%d %I:%M %p")
-                except Exception:
-                    pass
-        for key in ("date", "day", "start_date", "end_date"):
-            if key in rr and rr[key]:
+# Convert SQL UTC-default timestamps to user's current timezone.
+# Pass inplace=True when the caller owns the row dicts (e.g. fresh from execute_sql_gen_tool) to skip the per-row copy.
+def localize_health_rows(rows: list[dict], tz: str, *, inplace: bool = False) -> list[dict]:
+    if not rows:
+        return rows if inplace else []
+    # Work column by column over only the columns the result actually has
+    # (rows from one query share a column set), instead of probing every candidate key on every row.
+    cols = set().union(*rows)
+    if _LOCAL_COLS.isdisjoint(cols):
+        return rows if inplace else [dict(r) for r in rows]
+
+    zone = _request_zone(tz)
+    out: list[dict] = rows if inplace else [dict(r) for r in rows]
+
+    # Localize any timestamp-like fields into the user's current timezone for display.
+    # Note: workout timestamps may be further rewritten upstream using per-event timezone in main_health_events.hk_metadata (HKTimeZone).
+    # Datetimes are formatted together after the scan (see _fmt_local_many) and scattered back.
+    pending: list[tuple[dict, str]] = []
+    pending_dts: list[datetime] = []
+    for key in _LOCAL_TS_KEYS:
+        if key not in cols:
+            continue
+        for rr in out:
+            dt = rr.get(key)
+            if not dt:
+                continue
+            try:
+                # If already formatted as a string upstream, leave as-is.
+                if isinstance(dt, str):
+                    continue
+                if isinstance(dt, datetime):
+                    pending.append((rr, key))
+                    pending_dts.append(dt)
+                    continue
+                if getattr(dt, "tzinfo", None) is None:
+                    dt = dt.replace(tzinfo=_UTC)
+                rr[key] = _fmt_local(dt.astimezone(zone))
+            except Exception:
+                pass
+    if pending_dts:
+        for (rr, key), formatted in zip(pending, _fmt_local_many(pending_dts, zone)):
+            rr[key] = formatted
+
+    for key in _LOCAL_DATE_KEYS:
+        if key not in cols:
+            continue
+        for rr in out:
+            d = rr.get(key)
+            if d:
                 try:
-                    d = rr[key]
                     rr[key] = d.isoformat() if hasattr(d, "isoformat") else str(d)
                 except Exception:
                     pass
-        out.append(rr)
     return out
 
 
-def _rewrite_event_timestamps_inplace(*, session, user_id: str, rows: list[dict], request_tz: str) -> None:
-    """Rewrite workout/event timestamps to the timezone active when the event occurred (from main_health_events.hk_metadata['HKTimeZone'])."""
-    candidate_keys = ("workout_ts", "workout_timestamp", "timestamp")
+# Lookup keys gathered from the result rows in a single scan, one group per rewrite pass
+@dataclass
+class _RewriteKeys:
+    event_ts: dict[object, None] = field(default_factory=dict)
+    event_row_tz: dict[object, str] = field(default_factory=dict)
+    workout_uuids: set[str] = field(default_factory=set)
+    workout_starts: set[object] = field(default_factory=set)
+    workout_uuid_tz: dict[str, str | None] = field(default_factory=dict)
+    workout_start_tz: dict[object, str | None] = field(default_factory=dict)
+    rollup_pairs: dict[tuple[object, str | None], None] = field(default_factory=dict)
+    rollup_row_tz: dict[tuple[object, str | None], str] = field(default_factory=dict)
+    sleep_dates: set[object] = field(default_factory=set)
+
+
+# Rewrite timestamp columns in-place using each row's recorded timezone.
+# Rows are scanned once for all lookup keys and once more to apply every pass; the DB lookups
+# for the four passes run concurrently in between (one session each).
+# Passes whose columns aren't in the result (when `columns` is given) are dropped up front, so the per-row
+# apply never type-checks keys that no row can have.
+async def _rewrite_timestamps_inplace(
+    *, user_id: str, rows: list[dict], request_tz: str, columns=None, data_version: str | None = None
+) -> None:
+    if not rows:
+        return
+    passes = _REWRITE_PASSES
+    if columns is not None:
+        passes = tuple(p for p in passes if not p[0].isdisjoint(columns))
+        if not passes:
+            return
+    keys = _scan_rewrite_keys(rows)
+    lookups = await asyncio.gather(
+        *(_lookup_with_own_session(lookup, user_id, keys, data_version) for _cols, lookup, _apply_row in passes),
+        return_exceptions=True,
+    )
+    appliers = [
+        (apply_row, tz_lookup)
+        for (_cols, _lookup, apply_row), tz_lookup in zip(passes, lookups)
+        if not isinstance(tz_lookup, BaseException)
+    ]
+    if not appliers:
+        return
+    fmt = _cached_tz_formatter(_request_zone(request_tz))
+    # Passes run in _REWRITE_PASSES order within each row, so the first pass to set event_tz wins.
+    for rr in rows:
+        for apply_row, tz_lookup in appliers:
+            try:
+                apply_row(rr, tz_lookup, fmt)
+            except Exception:
+                pass
+
+
+# The session only checks out a connection on its first query, so fully cached lookups never touch the pool.
+async def _lookup_with_own_session(lookup, user_id: str, keys: _RewriteKeys, data_version: str | None):
+    async with AsyncSessionLocal() as session:
+        return await lookup(session=session, user_id=user_id, keys=keys, data_version=data_version)
+
+
+# Run a lookup statement in a read-only transaction (each lookup session issues a single query)
+async def _readonly_execute(session, stmt, params: dict):
+    await session.connection(execution_options=_READONLY_TXN)
+    return await session.execute(stmt, params)
+
 
-    ts_vals = []
+# A None data_version (unknown) bypasses the cache in both directions
+def _meta_tz_cache_get(key: tuple, data_version: str | None):
+    if data_version is None:
+        return _MISS
+    hit = _META_TZ_CACHE.get(key)
+    if hit is None:
+        return _MISS
+    stored_at, stored_version, tzv = hit
+    if stored_version != data_version or time.monotonic() - stored_at >= _META_TZ_TTL_SECONDS:
+        _META_TZ_CACHE.pop(key, None)
+        return _MISS
+    _META_TZ_CACHE.move_to_end(key)
+    return tzv
+
+
+def _meta_tz_cache_put(key: tuple, data_version: str | None, tzv: str | None) -> None:
+    if data_version is None:
+        return
+    _META_TZ_CACHE[key] = (time.monotonic(), data_version, tzv)
+    _META_TZ_CACHE.move_to_end(key)
+    while len(_META_TZ_CACHE) > _META_TZ_MAX_ENTRIES:
+        _META_TZ_CACHE.popitem(last=False)
+
+
+def _scan_rewrite_keys(rows: list[dict]) -> _RewriteKeys:
+    keys = _RewriteKeys()
     for rr in rows:
-        for k in candidate_keys:
+        # Event pass: first aware datetime among the event timestamp columns.
+        for k in _EVENT_TS_KEYS:
             v = rr.get(k)
-            # Only consider actual datetime values
-            if getattr(v, "tzinfo", None) is not None:
-                ts_vals.append(v)
+            if isinstance(v, datetime) and v.tzinfo is not None:
+                keys.event_ts[v] = None
+                # Rows that selected hk_metadata already carry their timezone; no lookup needed for them.
+                tzv = _workout_tz_from_meta(rr.get("hk_metadata"))
+                if tzv:
+                    keys.event_row_tz.setdefault(v, tzv)
                 break
 
-    if not ts_vals:
-        return
+        # Workout pass. Heuristic: segment rows have many per-segment columns; their start_ts is not the workout start_ts.
+        is_segment = not _SEGMENT_COLS.isdisjoint(rr)
+        wid = rr.get("workout_uuid")
+        if isinstance(wid, str) and wid.strip():
+            keys.workout_uuids.add(wid.strip())
+        wst = rr.get("workout_start_ts")
+        if isinstance(wst, datetime) and wst.tzinfo is not None:
+            keys.workout_starts.add(wst)
+        st = rr.get("start_ts")
+        st_aware = isinstance(st, datetime) and st.tzinfo is not None
+        if st_aware and not is_segment:
+            keys.workout_starts.add(st)
+        # If we already have hk_metadata in-row for workouts, prefer it and avoid DB lookups.
+        tzv = _workout_tz_from_meta(rr.get("hk_metadata"))
+        if tzv:
+            if isinstance(wid, str) and wid.strip():
+                keys.workout_uuid_tz.setdefault(wid.strip(), tzv)
+            if st_aware:
+                keys.workout_start_tz.setdefault(st, tzv)
+
+        # Rollup pass: (bucket_ts, metric_type) pairs, preferring meta if the SQL row already selected it.
+        dt = rr.get("bucket_ts")
+        if isinstance(dt, datetime) and dt.tzinfo is not None:
+            mt = rr.get("metric_type")
+            pair = (dt, mt if isinstance(mt, str) and mt else None)
+            keys.rollup_pairs[pair] = None
+            meta = rr.get("meta")
+            if isinstance(meta, dict):
+                tz_raw = meta.get("tz_name") or meta.get("timezone")
+                if isinstance(tz_raw, str) and tz_raw.strip():
+                    keys.rollup_row_tz[pair] = tz_raw.strip()
 
+        # Sleep pass; rows whose selected meta has the timezone are formatted from it, so skip their lookup.
+        sd = rr.get("sleep_date")
+        if sd is not None:
+            meta = rr.get("meta")
+            tz_raw = (meta.get("tz_name") or meta.get("timezone")) if isinstance(meta, dict) else None
+            if not (isinstance(tz_raw, str) and tz_raw.strip()):
+                keys.sleep_dates.add(sd)
+    return keys
+
+
+async def _lookup_event_tz(*, session, user_id: str, keys: _RewriteKeys, data_version: str | None = None) -> dict[object, str | None]:
+    """Look up the timezone active when each workout event occurred (from main_health_events.hk_metadata['HKTimeZone'])."""
+    if not keys.event_ts:
+        return {}
+    tz_map: dict[object, str | None] = dict.fromkeys(keys.event_ts)
+    tz_map.update(keys.event_row_tz)
     uniq_ts = []
-    seen = set()
-    for dt in ts_vals:
-        if dt not in seen:
-            seen.add(dt)
+    for dt, tzv in tz_map.items():
+        if tzv:
+            continue
+        cached = _meta_tz_cache_get(("event", user_id, dt), data_version)
+        if cached is _MISS:
             uniq_ts.append(dt)
-
+        else:
+            tz_map[dt] = cached
     if not uniq_ts:
-        return
-
-    tz_map: dict[object, str | None] = {}
-    for dt in uniq_ts:
-        meta_row = session.execute(
-            text(
-                """
-                SELECT hk_metadata
-                FROM main_health_events
-                WHERE user_id = :user_id
-                  AND timestamp = :ts
-                  AND event_type LIKE 'workout_%'
-                LIMIT 1
-                """
-            ),
-            {"user_id": user_id, "ts": dt},
-        ).mappings().first()
-        meta = meta_row.get("hk_metadata") if meta_row else None
-        tzv = None
+        return tz_map
+
+    # One round trip for all timestamps (instead of one SELECT per timestamp).
+    meta_rows = (await _readonly_execute(
+        session,
+        _Q_EVENT_META,
+        {"user_id": user_id, "ts_vals": uniq_ts},
+    )).mappings().all()
+    for mr in meta_rows:
+        dt = mr.get("timestamp")
+        if dt not in tz_map or tz_map[dt]:
+            continue
+        meta = mr.get("hk_metadata")
         if isinstance(meta, dict):
             # HealthKit commonly stores timezone for workouts as HKTimeZone (IANA name).
             tz_raw = meta.get("HKTimeZone") or meta.get("tz_name") or meta.get("timezone")
             if isinstance(tz_raw, str) and tz_raw.strip():
-                tzv = tz_raw.strip()
-        tz_map[dt] = tzv
+                tz_map[dt] = tz_raw.strip()
+    for dt in uniq_ts:
+        _meta_tz_cache_put(("event", user_id, dt), data_version, tz_map[dt])
+    return tz_map
 
-    def _format_event_dt(dt):
-        tzv = tz_map.get(dt)
-        try:
-            if tzv:
-                return dt.astimezone(ZoneInfo(tzv)).strftime("%Y-%m-%d %I:%M %p"), tzv
-        except Exception:
-            pass
-        # Fallback: use current request tz
-        try:
-            return dt.astimezone(ZoneInfo(request_tz)).strftime("%Y-%m-%d %I:%M %p"), None
-        except Exception:
-            return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %I:%M %p"), None
 
-    for rr in rows:
-        for k in candidate_keys:
-            v = rr.get(k)
-            if getattr(v, "tzinfo", None) is not None and v in tz_map:
-                formatted, tzv = _format_event_dt(v)
-                rr[k] = formatted
-                # Optional: expose tz for the model to mention if helpful
-                if tzv and "event_tz" not in rr:
-                    rr["event_tz"] = tzv
-                break
+def _apply_event_tz(rr: dict, tz_map: dict[object, str | None], fmt) -> None:
+    """Rewrite a row's workout/event timestamp using the timezones from _lookup_event_tz."""
+    if not tz_map:
+        return
+    for k in _EVENT_TS_KEYS:
+        v = rr.get(k)
+        if isinstance(v, datetime) and v.tzinfo is not None and v in tz_map:
+            # Falls back to the current request tz
+            formatted, tzv = fmt(v, tz_map.get(v))
+            rr[k] = formatted
+            # Optional: expose tz for the model to mention if helpful
+            if tzv and "event_tz" not in rr:
+                rr["event_tz"] = tzv
+            break
 
 
-def _rewrite_workout_timestamps_inplace(*, session, user_id: str, rows: list[dict], request_tz: str) -> None:
-    """Rewrite derived workout timestamps (start_ts/end_ts/segment timestamps) to the timezone active when recorded.
+def _workout_tz_from_meta(meta_obj) -> str | None:
+    if isinstance(meta_obj, dict):
+        tz_raw = meta_obj.get("HKTimeZone") or meta_obj.get("tz_name") or meta_obj.get("timezone")
+        if isinstance(tz_raw, str) and tz_raw.strip():
+            return tz_raw.strip()
+    return None
+
+
+async def _lookup_workout_tz(
+    *, session, user_id: str, keys: _RewriteKeys, data_version: str | None = None
+) -> tuple[dict[str, str | None], dict[object, str | None]]:
+    """Look up the timezone for derived workout rows, keyed by workout_uuid and by workout start_ts.
 
     - For derived_workouts, timezone comes from derived_workouts.hk_metadata ("HKTimeZone" or injected "tz_name"/"timezone").
     - For derived_workout_segments, timezone comes from the parent workout (derived_workouts.hk_metadata) via workout_uuid.
-    - Fallback: request_tz.
     """
-
-    def _tz_from_meta(meta_obj) -> str | None:
-        if isinstance(meta_obj, dict):
-            tz_raw = meta_obj.get("HKTimeZone") or meta_obj.get("tz_name") or meta_obj.get("timezone")
-            if isinstance(tz_raw, str) and tz_raw.strip():
-                return tz_raw.strip()
-        return None
-
-    # Collect workout_uuids and/or candidate workout start_ts values we might use to look up hk_metadata.
-    workout_uuids: set[str] = set()
-    workout_start_ts_vals: set[object] = set()
-    start_ts_vals: set[object] = set()
-
-    for rr in rows:
-        # Heuristic: segment rows have many per-segment columns; their start_ts is not the workout start_ts.
-        is_segment = any(k in rr for k in ("segment_index", "segment_unit", "pace_s_per_unit", "start_offset_min", "end_offset_min"))
-        wid = rr.get("workout_uuid")
-        if isinstance(wid, str) and wid.strip():
-            workout_uuids.add(wid.strip())
-        wst = rr.get("workout_start_ts")
-        if getattr(wst, "tzinfo", None) is not None:
-            workout_start_ts_vals.add(wst)
-        if not is_segment:
-            st = rr.get("start_ts")
-            if getattr(st, "tzinfo", None) is not None:
-                start_ts_vals.add(st)
-
-    # If we already have hk_metadata in-row for workouts, prefer it and avoid DB lookups.
-    uuid_tz: dict[str, str | None] = {}
-    start_tz: dict[object, str | None] = {}
-
-    for rr in rows:
-        meta = rr.get("hk_metadata")
-        tzv = _tz_from_meta(meta)
-        wid = rr.get("workout_uuid")
-        if tzv and isinstance(wid, str) and wid.strip():
-            uuid_tz.setdefault(wid.strip(), tzv)
-        st = rr.get("start_ts")
-        if tzv and getattr(st, "tzinfo", None) is not None:
-            start_tz.setdefault(st, tzv)
-
-    # Look up remaining workout_uuids in derived_workouts.
-    missing_uuids = [u for u in workout_uuids if u not in uuid_tz]
-    if missing_uuids:
-        meta_rows = session.execute(
-            text(
-                """
-                SELECT workout_uuid, hk_metadata
-                FROM derived_workouts
-                WHERE user_id = :user_id
-                  AND workout_uuid IN :uuids
-                """
-            ).bindparams(bindparam("uuids", expanding=True)),
-            {"user_id": user_id, "uuids": missing_uuids},
-        ).mappings().all()
+    uuid_tz = dict(keys.workout_uuid_tz)
+    start_tz = dict(keys.workout_start_tz)
+
+    # Look up remaining workout_uuids and start_ts values in derived_workouts in one round trip
+    # (start_ts covers queries that only returned start_ts; workout_start_ts covers segment-only
+    # result sets without workout_uuid).
+    missing_uuids = [u for u in keys.workout_uuids if u not in uuid_tz]
+    missing_starts = [dt for dt in keys.workout_starts if dt not in start_tz]
+    if missing_uuids or missing_starts:
+        meta_rows = (await _readonly_execute(
+            session,
+            _Q_WORKOUT_META,
+            {"user_id": user_id, "uuids": missing_uuids, "starts": missing_starts},
+        )).mappings().all()
         for mr in meta_rows:
+            tzv = _workout_tz_from_meta(mr.get("hk_metadata"))
             wid = mr.get("workout_uuid")
-            tzv = _tz_from_meta(mr.get("hk_metadata"))
             if isinstance(wid, str) and wid.strip():
                 uuid_tz.setdefault(wid.strip(), tzv)
-
-    # Look up remaining start_ts values in derived_workouts (covers queries that only returned start_ts).
-    missing_start_ts = [dt for dt in start_ts_vals if dt not in start_tz]
-    if missing_start_ts:
-        meta_rows = session.execute(
-            text(
-                """
-                SELECT start_ts, hk_metadata
-                FROM derived_workouts
-                WHERE user_id = :user_id
-                  AND start_ts IN :start_ts_vals
-                """
-            ).bindparams(bindparam("start_ts_vals", expanding=True)),
-            {"user_id": user_id, "start_ts_vals": missing_start_ts},
-        ).mappings().all()
-        for mr in meta_rows:
-            st = mr.get("start_ts")
-            if getattr(st, "tzinfo", None) is None:
-                continue
-            tzv = _tz_from_meta(mr.get("hk_metadata"))
-            start_tz.setdefault(st, tzv)
-
-    # Look up workout_start_ts values (covers segment-only result sets without workout_uuid).
-    missing_workout_start_ts = [dt for dt in workout_start_ts_vals if dt not in start_tz]
-    if missing_workout_start_ts:
-        meta_rows = session.execute(
-            text(
-                """
-                SELECT start_ts, hk_metadata
-                FROM derived_workouts
-                WHERE user_id = :user_id
-                  AND start_ts IN :start_ts_vals
-                """
-            ).bindparams(bindparam("start_ts_vals", expanding=True)),
-            {"user_id": user_id, "start_ts_vals": missing_workout_start_ts},
-        ).mappings().all()
-        for mr in meta_rows:
             st = mr.get("start_ts")
-            if getattr(st, "tzinfo", None) is None:
-                continue
-            tzv = _tz_from_meta(mr.get("hk_metadata"))
-            start_tz.setdefault(st, tzv)
+            if isinstance(st, datetime) and st.tzinfo is not None:
+                start_tz.setdefault(st, tzv)
 
-    def _format_dt(dt, tzv: str | None):
-        # Prefer per-row timezone when valid; fallback to request_tz.
-        try:
-            if tzv:
-                return dt.astimezone(ZoneInfo(tzv)).strftime("%Y-%m-%d %I:%M %p"), tzv
-        except Exception:
-            pass
-        try:
-            return dt.astimezone(ZoneInfo(request_tz)).strftime("%Y-%m-%d %I:%M %p"), None
-        except Exception:
-            return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %I:%M %p"), None
+    return uuid_tz, start_tz
 
-    # Rewrite timestamps in-place.
-    candidate_ts_keys = ("start_ts", "end_ts", "workout_start_ts")
-    for rr in rows:
-        is_segment = any(k in rr for k in ("segment_index", "segment_unit", "pace_s_per_unit", "start_offset_min", "end_offset_min"))
-        tzv = _tz_from_meta(rr.get("hk_metadata"))
-        if not tzv:
-            wid = rr.get("workout_uuid")
-            if isinstance(wid, str) and wid.strip():
-                tzv = uuid_tz.get(wid.strip())
-        if not tzv:
-            wst = rr.get("workout_start_ts")
-            if getattr(wst, "tzinfo", None) is not None:
-                tzv = start_tz.get(wst)
-        if not tzv and not is_segment:
-            st = rr.get("start_ts")
-            if getattr(st, "tzinfo", None) is not None:
-                tzv = start_tz.get(st)
-
-        for k in candidate_ts_keys:
-            v = rr.get(k)
-            if getattr(v, "tzinfo", None) is None:
-                continue
-            # If already formatted as a string upstream, leave as-is.
-            if isinstance(v, str):
-                continue
-            formatted, tz_used = _format_dt(v, tzv)
-            rr[k] = formatted
-            # Optional: expose tz for the model to mention if helpful
-            if tz_used and "event_tz" not in rr:
-                rr["event_tz"] = tz_used
 
+def _apply_workout_tz(rr: dict, lookup: tuple[dict, dict], fmt) -> None:
+    """Rewrite a row's derived workout timestamps (start_ts/end_ts/segment timestamps) to the timezone active when recorded.
 
-def _rewrite_rollup_bucket_ts_inplace(*, session, user_id: str, rows: list[dict], request_tz: str) -> None:
-    """Rewrite rollup bucket_ts to the timezone active when the bucket occurred (from rollup meta)."""
-    bucket_key = "bucket_ts"
+    Fallback: request_tz.
+    """
+    uuid_tz, start_tz = lookup
+    tzv = _workout_tz_from_meta(rr.get("hk_metadata"))
+    if not tzv:
+        wid = rr.get("workout_uuid")
+        if isinstance(wid, str) and wid.strip():
+            tzv = uuid_tz.get(wid.strip())
+    if not tzv:
+        wst = rr.get("workout_start_ts")
+        if isinstance(wst, datetime) and wst.tzinfo is not None:
+            tzv = start_tz.get(wst)
+    # Segment check only matters for this last fallback, so it is evaluated only when reached.
+    if not tzv and _SEGMENT_COLS.isdisjoint(rr):
+        st = rr.get("start_ts")
+        if isinstance(st, datetime) and st.tzinfo is not None:
+            tzv = start_tz.get(st)
 
-    # Collect unique (bucket_ts, metric_type) pairs that look like datetimes
-    pairs: list[tuple[object, str | None]] = []
-    row_meta_tz: dict[tuple[object, str | None], str] = {}
-    for rr in rows:
-        dt = rr.get(bucket_key)
-        if getattr(dt, "tzinfo", None) is None:
+    for k in _WORKOUT_TS_KEYS:
+        v = rr.get(k)
+        # Skips values already formatted as a string upstream.
+        if not isinstance(v, datetime) or v.tzinfo is None:
             continue
-        mt = rr.get("metric_type")
-        mtv = mt if isinstance(mt, str) and mt else None
-        pairs.append((dt, mtv))
-
-        # Prefer meta if the SQL row already included it (query explicitly selected meta)
-        meta = rr.get("meta")
-        if isinstance(meta, dict):
-            tz_raw = meta.get("tz_name") or meta.get("timezone")
-            if isinstance(tz_raw, str) and tz_raw.strip():
-                row_meta_tz[(dt, mtv)] = tz_raw.strip()
-
-    if not pairs:
-        return
+        # Prefer per-row timezone when valid; fallback to request_tz.
+        formatted, tz_used = fmt(v, tzv)
+        rr[k] = formatted
+        # Optional: expose tz for the model to mention if helpful
+        if tz_used and "event_tz" not in rr:
+            rr["event_tz"] = tz_used
 
-    uniq_pairs = []
-    seen_pairs = set()
-    for dt, mt in pairs:
-        key = (dt, mt)
-        if key not in seen_pairs:
-            seen_pairs.add(key)
-            uniq_pairs.append((dt, mt))
 
-    if not uniq_pairs:
-        return
+async def _lookup_rollup_tz(
+    *, session, user_id: str, keys: _RewriteKeys, data_version: str | None = None
+) -> dict[tuple[object, str | None], str | None]:
+    """Look up the timezone active when each rollup bucket occurred (from rollup meta)."""
+    if not keys.rollup_pairs:
+        return {}
 
     tz_map: dict[tuple[object, str | None], str | None] = {}
-    for dt, mt in uniq_pairs:
-        tzv = row_meta_tz.get((dt, mt))
+    pending: list[tuple[object, str | None]] = []
+    for key in keys.rollup_pairs:
+        tzv = keys.rollup_row_tz.get(key)
         if tzv:
-            tz_map[(dt, mt)] = tzv
+            tz_map[key] = tzv
             continue
-
-        # Try hourly first; if not present, try daily (restored in mirror mode).
-        meta_row = None
-        if mt:
-            meta_row = session.execute(
-                text(
-                    """
-                    SELECT meta
-                    FROM derived_rollup_hourly
-                    WHERE user_id = :user_id
-                      AND bucket_ts = :ts
-                      AND metric_type = :mt
-                    LIMIT 1
-                    """
-                ),
-                {"user_id": user_id, "ts": dt, "mt": mt},
-            ).mappings().first()
-            if not meta_row:
-                meta_row = session.execute(
-                    text(
-                        """
-                        SELECT meta
-                        FROM derived_rollup_daily
-                        WHERE user_id = :user_id
-                          AND bucket_ts = :ts
-                          AND metric_type = :mt
-                        LIMIT 1
-                        """
-                    ),
-                    {"user_id": user_id, "ts": dt, "mt": mt},
-                ).mappings().first()
+        cached = _meta_tz_cache_get(("rollup", user_id, *key), data_version)
+        if cached is _MISS:
+            pending.append(key)
         else:
-            meta_row = session.execute(
-                text(
-                    """
-                    SELECT meta
-                    FROM derived_rollup_hourly
-                    WHERE user_id = :user_id
-                      AND bucket_ts = :ts
-                    LIMIT 1
-                    """
-                ),
-                {"user_id": user_id, "ts": dt},
-            ).mappings().first()
-            if not meta_row:
-                meta_row = session.execute(
-                    text(
-                        """
-                        SELECT meta
-                        FROM derived_rollup_daily
-                        WHERE user_id = :user_id
-                          AND bucket_ts = :ts
-                        LIMIT 1
-                        """
-                    ),
-                    {"user_id": user_id, "ts": dt},
-                ).mappings().first()
-
-        meta = meta_row.get("meta") if meta_row else None
-        if isinstance(meta, dict):
-            tz_raw = meta.get("tz_name") or meta.get("timezone")
-            if isinstance(tz_raw, str) and tz_raw.strip():
-                tzv = tz_raw.strip()
-
-        tz_map[(dt, mt)] = tzv
-
-    def _format_bucket_dt(dt, mt):
-        tzv = tz_map.get((dt, mt)) or tz_map.get((dt, None))
-        try:
-            if tzv:
-                return dt.astimezone(ZoneInfo(tzv)).strftime("%Y-%m-%d %I:%M %p"), tzv
-        except Exception:
-            pass
-        try:
-            return dt.astimezone(ZoneInfo(request_tz)).strftime("%Y-%m-%d %I:%M %p"), None
-        except Exception:
-            return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %I:%M %p"), None
+            tz_map[key] = cached
+
+    if pending:
+        meta_rows = (await _readonly_execute(
+            session,
+            _Q_ROLLUP_META,
+            {
+                "user_id": user_id,
+                "pair_ts": [dt for dt, _mt in pending],
+                "pair_mts": [mt for _dt, mt in pending],
+            },
+        )).mappings().all()
+        for r in meta_rows:
+            meta = r.get("meta")
+            tzv = None
+            if isinstance(meta, dict):
+                tz_raw = meta.get("tz_name") or meta.get("timezone")
+                if isinstance(tz_raw, str) and tz_raw.strip():
+                    tzv = tz_raw.strip()
+            tz_map[(r.get("bucket_ts"), r.get("metric_type"))] = tzv
+        for key in pending:
+            _meta_tz_cache_put(("rollup", user_id, *key), data_version, tz_map.get(key))
 
-    for rr in rows:
-        dt = rr.get(bucket_key)
-        if getattr(dt, "tzinfo", None) is None:
-            continue
-        # If already formatted as string upstream, leave as-is.
-        if isinstance(dt, str):
-            continue
-        mt = rr.get("metric_type")
-        mtv = mt if isinstance(mt, str) and mt else None
-        formatted, tzv = _format_bucket_dt(dt, mtv)
-        rr[bucket_key] = formatted
-        if tzv and "bucket_tz" not in rr:
-            rr["bucket_tz"] = tzv
+    return tz_map
 
 
-def _rewrite_sleep_daily_timestamps_inplace(*, session, user_id: str, rows: list[dict], request_tz: str) -> None:
-    """Rewrite derived_sleep_daily timestamps to the timezone active when the sleep was recorded (from row meta tz_name)."""
+def _apply_rollup_tz(rr: dict, tz_map: dict[tuple[object, str | None], str | None], fmt) -> None:
+    """Rewrite a row's rollup bucket_ts to the timezone active when the bucket occurred."""
+    dt = rr.get("bucket_ts")
+    # Skips values already formatted as a string upstream.
+    if not isinstance(dt, datetime) or dt.tzinfo is None:
+        return
+    mt = rr.get("metric_type")
+    mtv = mt if isinstance(mt, str) and mt else None
+    tzv = tz_map.get((dt, mtv)) or tz_map.get((dt, None))
+    formatted, tzv = fmt(dt, tzv)
+    rr["bucket_ts"] = formatted
+    if tzv and "bucket_tz" not in rr:
+        rr["bucket_tz"] = tzv
 
-    candidate_keys = ("sleep_start_ts", "sleep_end_ts")
-    # Collect sleep_date keys we can use to fetch meta tz if the SQL row didn't include meta.
-    sleep_dates: set[object] = set()
-    for rr in rows:
-        sd = rr.get("sleep_date")
-        if sd is not None:
-            sleep_dates.add(sd)
 
+async def _lookup_sleep_tz(*, session, user_id: str, keys: _RewriteKeys, data_version: str | None = None) -> dict[object, str | None]:
+    """Look up derived_sleep_daily meta timezones by sleep_date (for rows that didn't select meta)."""
     tz_by_date: dict[object, str | None] = {}
-    if sleep_dates:
-        meta_rows = session.execute(
-            text(
-                """
-                SELECT sleep_date, meta
-                FROM derived_sleep_daily
-                WHERE user_id = :user_id
-                  AND sleep_date = ANY(:sleep_dates)
-                """
-            ),
-            {"user_id": user_id, "sleep_dates": list(sleep_dates)},
-        ).mappings().all()
+    pending = []
+    for sd in keys.sleep_dates:
+        cached = _meta_tz_cache_get(("sleep", user_id, sd), data_version)
+        if cached is _MISS:
+            pending.append(sd)
+        else:
+            tz_by_date[sd] = cached
+    if pending:
+        meta_rows = (await _readonly_execute(
+            session,
+            _Q_SLEEP_META,
+            {"user_id": user_id, "sleep_dates": pending},
+        )).mappings().all()
         for mr in meta_rows:
             sd = mr.get("sleep_date")
             meta = mr.get("meta")
@@ -545,36 +881,38 @@ def _rewrite_sleep_daily_timestamps_inplace(*, session, user_id: str, rows: list
                     tzv = tz_raw.strip()
             if sd is not None:
                 tz_by_date[sd] = tzv
+        for sd in pending:
+            _meta_tz_cache_put(("sleep", user_id, sd), data_version, tz_by_date.get(sd))
+    return tz_by_date
+
+
+def _apply_sleep_tz(rr: dict, tz_by_date: dict[object, str | None], fmt) -> None:
+    """Rewrite a row's derived_sleep_daily timestamps to the timezone active when the sleep was recorded (from row meta tz_name)."""
+    tzv = None
+    meta = rr.get("meta")
+    if isinstance(meta, dict):
+        tz_raw = meta.get("tz_name") or meta.get("timezone")
+        if isinstance(tz_raw, str) and tz_raw.strip():
+            tzv = tz_raw.strip()
+    if not tzv:
+        sd = rr.get("sleep_date")
+        if sd is not None:
+            tzv = tz_by_date.get(sd)
 
-    def _format_dt(dt, tzv: str | None):
-        try:
-            if tzv:
-                return dt.astimezone(ZoneInfo(tzv)).strftime("%Y-%m-%d %I:%M %p"), tzv
-        except Exception:
-            pass
-        try:
-            return dt.astimezone(ZoneInfo(request_tz)).strftime("%Y-%m-%d %I:%M %p"), None
-        except Exception:
-            return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %I:%M %p"), None
-
-    for rr in rows:
-        tzv = None
-        meta = rr.get("meta")
-        if isinstance(meta, dict):
-            tz_raw = meta.get("tz_name") or meta.get("timezone")
-            if isinstance(tz_raw, str) and tz_raw.strip():
-                tzv = tz_raw.strip()
-        if not tzv:
-            sd = rr.get("sleep_date")
-            if sd is not None:
-                tzv = tz_by_date.get(sd)
-
-        for k in candidate_keys:
-            v = rr.get(k)
-            if getattr(v, "tzinfo", None) is None or isinstance(v, str):
-                continue
-            formatted, tz_used = _format_dt(v, tzv)
-            rr[k] = formatted
-            if tz_used and "event_tz" not in rr:
-                rr["event_tz"] = tz_used
-
+    for k in _SLEEP_TS_KEYS:
+        v = rr.get(k)
+        if not isinstance(v, datetime) or v.tzinfo is None:
+            continue
+        formatted, tz_used = fmt(v, tzv)
+        rr[k] = formatted
+        if tz_used and "event_tz" not in rr:
+            rr["event_tz"] = tz_used
+
+
+# (columns it formats, lookup, per-row apply) per rewrite pass, in the order they are applied to each row.
+_REWRITE_PASSES = (
+    (frozenset(_EVENT_TS_KEYS), _lookup_event_tz, _apply_event_tz),
+    (frozenset(_WORKOUT_TS_KEYS), _lookup_workout_tz, _apply_workout_tz),
+    (frozenset(("bucket_ts",)), _lookup_rollup_tz, _apply_rollup_tz),
+    (frozenset(_SLEEP_TS_KEYS), _lookup_sleep_tz, _apply_sleep_tz),
+)
@@ -2,19 +2,51 @@ import logging
 from typing import Optional
 
 from fastapi import APIRouter, Depends, File, Header, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, ORJSONResponse
 from sqlalchemy.orm import Session
 
 from Backend.auth import verify_clerk_jwt
 from Backend.database import get_db
-from Backend.services.health_upload_service import HealthUploadService
+from Backend.services.health_upload_service import DEFAULT_MAX_UPLOAD_BYTES, HealthUploadService
 
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+_UPLOAD_CSV_PATH = "/health/upload-csv"
+# Room for the multipart boundaries and part headers around the file itself
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+# Rejects oversized CSV uploads by Content-Length before FastAPI parses the multipart body.
+# The route can't do this itself: its UploadFile is fully received and spooled before it runs.
+# Requests without (or lying about) Content-Length still hit the byte counter in HealthUploadService._hash_upload.
+class UploadSizeLimitMiddleware:
+    def __init__(self, app, max_body_bytes: int = DEFAULT_MAX_UPLOAD_BYTES + _MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.max_body_bytes = int(max_body_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == _UPLOAD_CSV_PATH:
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    try:
+                        too_large = int(value) > self.max_body_bytes
+                    except ValueError:
+                        too_large = False
+                    if too_large:
+                        response = JSONResponse(
+                            status_code=413,
+                            content={"detail": f"Upload too large. Max size is {DEFAULT_MAX_UPLOAD_BYTES} bytes."},
+                        )
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
+
 
 # Upload a CSV file with SHA-256 deduplication
-@router.post("/health/upload-csv")
+@router.post(_UPLOAD_CSV_PATH)
 def upload_csv(
     file: UploadFile = File(...),
     request: Request = None,  # kept for backwards-compat with existing clients/middleware
@@ -27,11 +59,10 @@ def upload_csv(
     user = verify_clerk_jwt(request)
     user_id = user["sub"]
     svc = HealthUploadService(db)
-    content = file.file.read()
     file_name = getattr(file, "filename", "health.csv")
-    result = svc.enqueue_csv_bytes(
+    result = svc.enqueue_csv_upload(
         user_id=user_id,
-        content=content,
+        upload=file.file,
         file_name=file_name,
         upload_mode=x_upload_mode,
         seed_batch_id=x_seed_batch_id,
@@ -67,4 +98,5 @@ def seed_status(
     user = verify_clerk_jwt(request)
     user_id = user["sub"]
     svc = HealthUploadService(db)
-    return svc.get_seed_status(user_id=user_id, batch_id=batch_id, limit=limit)
\ No newline at end of file
+    # Returned as a response object so the per-chunk rows skip jsonable_encoder and go straight to orjson
+    return ORJSONResponse(content=svc.get_seed_status(user_id=user_id, batch_id=batch_id, limit=limit))
\ No newline at end of file